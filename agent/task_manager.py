@@ -1,79 +1,290 @@
 # dawnyawn/agent/task_manager.py (Final Version with Simplified Plan Update Logic)
 import os
-import json
+import re
+import time
+import uuid
+import queue
+import threading
+import hashlib
 import logging
+import pathlib
+import orjson
+from dataclasses import dataclass
+from concurrent.futures import Future
 from openai import APITimeoutError
-from models.task_node import TaskNode, TaskStatus
+from pydantic import ValidationError
+from config import PLAN_CACHE_TTL
+from agent.agent_scheduler import AgentScheduler
+from agent.thought_engine import ThoughtEngine, REPEATED_OBSERVATION_PREFIX
+from tools.tool_manager import ToolManager
+from services.mcp_client import McpClient
+from services.observation_store import ObservationStore
+from models.task_node import TaskNode, TaskStatus, PLAN_ADAPTER
+from models.history_record import HistoryRecord, HIST_ADAPTER
 from reporting.report_generator import create_report
 
 # --- Constants ---
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-PROJECTS_DIR = os.path.join(PROJECT_ROOT, "Projects")
-SESSION_FILE = os.path.join(PROJECTS_DIR, "mission_session.json")
+# Resolved once at import; all paths below are pathlib.Path objects.
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
+PROJECTS_DIR = PROJECT_ROOT / "Projects"
+SESSION_FILE = PROJECTS_DIR / "mission_session.json"
+SESSION_LOG = PROJECTS_DIR / "mission_session.json.log"  # One JSON line per mission_history entry.
+PLAN_CACHE_DIR = PROJECTS_DIR / "plan_cache"
+LLM_CACHE_DIR = PROJECTS_DIR / "llm_cache"  # Plan-status assessments reused across missions.
+OBSERVATIONS_DIR = PROJECTS_DIR / "observations"  # One subdirectory of raw outputs per mission.
+
+# Plan-status gate: skip the assessment LLM call unless the last step plausibly completed a task.
+STATUS_CHECK_INTERVAL = 3  # Force an assessment at least this often, whatever the heuristic says.
+# Literal substrings (checked in the first 512 bytes) that mark a step which cannot have completed a task.
+_FAILURE_MARKERS = ("command not found", "agent-side connection error", "command execution failed on server",
+                    "name or service not known", "unknown host", "could not resolve host")
+# Commands whose output cannot complete a pentest task on its own; checked against the first word of a
+# simple command only, since `cd /tmp && whois example.com` does real work.
+_NOOP_COMMANDS = frozenset({"ls", "pwd", "echo", "cd", "clear", "true", "date", "sleep"})
+_COMPOUND_MARKERS = ("&&", "||", ";", "|", "`", "$(")
+_NO_OUTPUT_SUFFIX = " produced no output."  # Ends the placeholder observation recorded for a silent command.
+_STOPWORDS = frozenset("a an and any are as at be by for from if in into is it its of on or the then this "
+                       "to use using with".split())
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def _tokens(text: str) -> set[str]:
+    return set(_TOKEN_RE.findall(text.lower())) - _STOPWORDS
+
+
+def _excerpt(summary: dict) -> str:
+    """Turns an McpClient output summary into the observation text kept in mission_history."""
+    if not summary["elided"]:
+        return summary["head"] + summary["tail"]
+    return f"{summary['head']}\n…[{summary['elided']} bytes elided]…\n{summary['tail']}"
+
+
+def _plan_cache_path(goal: str) -> pathlib.Path:
+    return PLAN_CACHE_DIR / (hashlib.sha1(goal.encode('utf-8')).hexdigest() + ".json")
+
+
+@dataclass(frozen=True)
+class TaskManagerOptions:
+    """Feature switches for a TaskManager; disabled features become no-ops."""
+    use_plan_status_updates: bool = True  # Ask the LLM which tasks the last step completed.
+    use_session_file: bool = True  # Persist the mission so an interrupted run can resume.
 
 
 class TaskManager:
     """Orchestrates the agent's lifecycle with dynamic plan status updates."""
 
-    def __init__(self, goal: str):
-        from agent.agent_scheduler import AgentScheduler
-        from agent.thought_engine import ThoughtEngine
-        from tools.tool_manager import ToolManager
-        from services.mcp_client import McpClient
-
+    def __init__(self, goal: str, options: TaskManagerOptions = TaskManagerOptions()):
         self.goal = goal
+        self.options = options
         self.plan: list[TaskNode] = []
-        self.mission_history = []
+        self.mission_history: list[HistoryRecord] = []
         self.scheduler = AgentScheduler()
-        self.thought_engine = ThoughtEngine(ToolManager())
+        self.thought_engine = ThoughtEngine(ToolManager(), cache_dir=LLM_CACHE_DIR)
         self.mcp_client = McpClient()
-        os.makedirs(PROJECTS_DIR, exist_ok=True)
+        self._set_mission_id(f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}")
+        self._log_fh = None  # Append-only handle on SESSION_LOG, opened when execution starts.
+        self._steps_since_status_check = 0
+        self._last_assessed_len = 0  # len(mission_history) when the last assessment was submitted.
+        self._session_written: bool | None = None  # None until the first stat; then tracked on write/remove.
+        # Header writes happen on a background thread; the queue holds only the newest snapshot.
+        self._save_q: queue.Queue[bytes] = queue.Queue(maxsize=1)
+        threading.Thread(target=self._save_worker, name="session-saver", daemon=True).start()
+        # Plan-status assessment in flight; its LLM call overlaps the next action choice.
+        self._pending_status: Future | None = None
+        PROJECTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    def _set_mission_id(self, mission_id: str):
+        """Names the mission; its raw outputs go to their own store, so step numbers never collide."""
+        self.mission_id = mission_id
+        self.observation_store = ObservationStore(OBSERVATIONS_DIR / mission_id)
 
     def initialize_mission(self):
         """Asks user whether to resume an old mission or start a new one."""
-        if os.path.exists(SESSION_FILE):
+        if self.options.use_session_file and self._session_exists():
             resume = input("\nAn existing session file was found. Do you want to resume? (y/n): ").lower()
             if resume != 'y':
-                os.remove(SESSION_FILE)
+                self._clear_session()
                 logging.info("Previous session file deleted. Starting a fresh mission.")
 
+    def _session_exists(self) -> bool:
+        if self._session_written is None:
+            self._session_written = os.path.exists(SESSION_FILE)
+        return self._session_written
+
+    def _should_update_plan(self, last_entry: HistoryRecord) -> bool:
+        """Cheap gate in front of the plan-status LLM call."""
+        if not self.options.use_plan_status_updates:
+            return False
+        if self.mission_history and len(self.mission_history) == self._last_assessed_len:
+            return False  # Nothing new since the last assessment.
+        # Counted before any skip, so a run of skipped steps still reaches the forced check.
+        self._steps_since_status_check += 1
+        command = last_entry.command
+        if (command.split() or [""])[0] in _NOOP_COMMANDS and not any(m in command for m in _COMPOUND_MARKERS):
+            return False
+        observation = str(last_entry.observation)
+        if not observation.strip() or observation.endswith(_NO_OUTPUT_SUFFIX):
+            return False  # No output, nothing for the assessment to read.
+        if (last_entry.observation_compact or "").startswith(REPEATED_OBSERVATION_PREFIX):
+            return False  # Byte-identical to an earlier output, so it carries no new evidence.
+        if observation.startswith("ERROR") or any(m in observation[:512].lower() for m in _FAILURE_MARKERS):
+            return False
+        if self._steps_since_status_check >= STATUS_CHECK_INTERVAL:
+            return True
+        command_tokens = _tokens(last_entry.command)
+        return any(len(command_tokens & _tokens(task.description)) >= 2
+                   for task in self.plan if task.status != TaskStatus.COMPLETED)
+
     # --- THE FIX: This method now takes a simple list of IDs and updates the plan ---
-    def _update_plan_status(self):
-        """Gets completed task IDs from the AI and updates the plan state."""
+    def _start_plan_status_update(self):
+        """Submits the plan-status assessment for the latest step; it overlaps the next action choice."""
+        self._steps_since_status_check = 0
+        self._last_assessed_len = len(self.mission_history)
         logging.info("📝 Assessing plan progress based on recent actions...")
-        completed_ids = self.thought_engine.get_completed_task_ids(self.goal, self.plan, self.mission_history)
+        # Snapshots, so the worker never sees the plan or history change underneath it.
+        plan = [task.model_copy() for task in self.plan]
+        history = list(self.mission_history)
+        future = self._pending_status = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.thought_engine.get_completed_task_ids(self.goal, plan, history))
+            except BaseException as e:
+                future.set_exception(e)
+        # A daemon thread, unlike an executor worker, is not joined at interpreter exit, so an
+        # assessment still waiting on the LLM cannot hold up Ctrl+C.
+        threading.Thread(target=run, name="plan-status", daemon=True).start()
+
+    def _apply_plan_status_update(self, wait: bool = True) -> bool:
+        """Marks a pending assessment's task IDs completed, waiting for it unless `wait` is False (then an
+        unfinished one is dropped). Returns True if the plan changed."""
+        if self._pending_status is None:
+            return False
+        future, self._pending_status = self._pending_status, None
+        if not wait and not future.done():
+            logging.info("  - Pending plan assessment dropped; the mission was aborted.")
+            return False
+        completed_ids = future.result()
 
         if not completed_ids:
             logging.info("  - No new tasks were marked as completed.")
-            return
+            return False
 
+        changed = False
         for task in self.plan:
             if task.task_id in completed_ids and task.status != TaskStatus.COMPLETED:
                 task.status = TaskStatus.COMPLETED
+                changed = True
                 logging.info("  - Status Updated: Task %d is now COMPLETED.", task.task_id)
+        return changed
+
+    # --- Session persistence: a small goal+plan header plus an append-only step log ---
+    def _save_header(self):
+        """Queues the goal and plan for writing. Only called after planning and when a task status changes."""
+        if not self.options.use_session_file:
+            return
+        plan_json = PLAN_ADAPTER.dump_json(self.plan)
+        header = (b'{"goal":' + orjson.dumps(self.goal) + b',"mission_id":' + orjson.dumps(self.mission_id)
+                  + b',"plan":' + plan_json + b'}')
+        try:
+            self._save_q.put_nowait(header)
+        except queue.Full:
+            # An older snapshot is still waiting; replace it, since only the latest state matters.
+            try:
+                self._save_q.get_nowait()
+                self._save_q.task_done()
+            except queue.Empty:
+                pass
+            self._save_q.put(header)
+
+    def _save_worker(self):
+        while True:
+            header = self._save_q.get()
+            try:
+                tmp_path = SESSION_FILE.with_name(SESSION_FILE.name + ".tmp")
+                tmp_path.write_bytes(header)
+                tmp_path.replace(SESSION_FILE)
+                self._session_written = True
+                logging.info("Mission plan saved to session file.")
+            except OSError as e:
+                logging.error("Failed to save session file: %s", e)
+            finally:
+                self._save_q.task_done()
+
+    def _wait_for_saves(self):
+        """Blocks until every queued header snapshot is on disk."""
+        self._save_q.join()
+
+    def _append_step(self, entry: HistoryRecord):
+        """Records a mission_history entry, writing only that entry to the session log."""
+        self.mission_history.append(entry)
+        if not self.options.use_session_file:
+            return
+        if self._log_fh is None:
+            self._open_log('ab')
+        self._log_fh.write(entry.model_dump_json(exclude_none=True).encode('utf-8') + b'\n')
+        self._log_fh.flush()  # Hands the line to the OS so a crashed run can still resume.
+
+    def _open_log(self, mode: str):
+        self._log_fh = open(SESSION_LOG, mode, buffering=64 * 1024)
+        self._session_written = True
+
+    def _close_log(self):
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
 
-    # ... ( _save_state and _load_state are unchanged) ...
-    def _save_state(self):
-        state = {"goal": self.goal, "plan": [task.model_dump() for task in self.plan],
-                 "mission_history": self.mission_history}
-        with open(SESSION_FILE, 'w', encoding='utf-8') as f: json.dump(state, f, indent=4)
-        logging.info("Mission state saved to session file.")
+    def _clear_session(self):
+        self._close_log()
+        if self._session_written is False:
+            return
+        for path in (SESSION_FILE, SESSION_LOG):
+            path.unlink(missing_ok=True)
+        self._session_written = False
+
+    # --- Plan cache: a goal that was planned before skips the planning LLM call ---
+    def _load_cached_plan(self) -> list[TaskNode]:
+        path = _plan_cache_path(self.goal)
+        try:
+            if time.time() - path.stat().st_mtime > PLAN_CACHE_TTL:
+                return []
+            return PLAN_ADAPTER.validate_json(path.read_bytes())
+        except (OSError, ValidationError):
+            return []
+
+    def _cache_plan(self):
+        path = _plan_cache_path(self.goal)
+        PLAN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(PLAN_ADAPTER.dump_json(self.plan))
+        tmp_path.replace(path)  # Atomic, so a half-written cache entry is never read.
 
     def _load_state(self):
-        if not os.path.exists(SESSION_FILE): return False
+        if not self.options.use_session_file or not self._session_exists(): return False
         try:
-            with open(SESSION_FILE, 'r', encoding='utf-8') as f:
-                state = json.load(f)
+            with open(SESSION_FILE, 'rb') as f:
+                state = orjson.loads(f.read())
             if state.get("goal") != self.goal:
                 logging.warning("Session file goal does not match. Starting fresh.")
-                os.remove(SESSION_FILE)
+                self._clear_session()
                 return False
-            self.plan = [TaskNode(**task_data) for task_data in state.get("plan", [])]
-            self.mission_history = state.get("mission_history", [])
+            if state.get("mission_id"):
+                self._set_mission_id(state["mission_id"])  # Resumed steps keep appending to the same store.
+            # The session file is our own output, so skip re-validating every task.
+            self.plan = [TaskNode.model_construct(**task_data) for task_data in state.get("plan", [])]
+            try:
+                with open(SESSION_LOG, 'rb') as f:
+                    lines = [line.rstrip(b'\n') for line in f if line.strip()]
+                self.mission_history = HIST_ADAPTER.validate_json(b'[' + b','.join(lines) + b']')
+            except FileNotFoundError:
+                self.mission_history = []  # Planned, but no step was taken before the interruption.
             logging.info("Successfully loaded and resumed mission.")
             return True
-        except (json.JSONDecodeError, TypeError) as e:
-            logging.error("Failed to load session file. Starting fresh.", e)
+        except (orjson.JSONDecodeError, TypeError, ValidationError) as e:
+            logging.error("Failed to load session file: %s. Starting fresh.", e)
+            self._clear_session()
             return False
 
     def run(self):
@@ -82,51 +293,110 @@ class TaskManager:
             # PLANNING PHASE
             logging.info("Starting new mission for goal: %s", self.goal)
             try:
-                self.plan = self.scheduler.create_plan(self.goal)
-                if not self.plan:
-                    logging.error("Mission aborted: Agent failed to generate a valid plan.");
-                    return
+                self.plan = self._load_cached_plan()
+                plan_was_cached = bool(self.plan)
+                if plan_was_cached:
+                    logging.info("Reusing cached plan for this goal.")
+                else:
+                    self.plan = self.scheduler.create_plan(self.goal)
+                    if not self.plan:
+                        logging.error("Mission aborted: Agent failed to generate a valid plan.");
+                        return
                 logging.info("High-Level Plan Created:")
                 for task in self.plan: logging.info("  %d. %s", task.task_id, task.description)
                 if input("\nProceed with this plan? (y/n): ").lower() != 'y':
+                    # A declined plan must not be served again on the next run.
+                    _plan_cache_path(self.goal).unlink(missing_ok=True)
                     logging.info("Mission aborted by user.");
                     return
-                self._save_state()
+                if not plan_was_cached:
+                    self._cache_plan()  # Only plans the user approved are reused.
+                if self.options.use_session_file:
+                    # Truncated now, not by the saver thread, so no step lands in a log left by an earlier run.
+                    self._open_log('wb')
+                self._save_header()
             except (APITimeoutError, KeyboardInterrupt) as e:
                 logging.error("Mission aborted during planning phase: %s", e);
                 return
 
         # EXECUTION LOOP
+        aborted = False
         try:
             while True:
+                # The previous step's assessment (if any) runs while the next action is chosen and
+                # while its command executes, so the choice may see the plan one step behind.
                 action = self.thought_engine.choose_next_action(self.goal, self.plan, self.mission_history)
                 if action.tool_name == "finish_mission":
+                    if self._apply_plan_status_update():
+                        self._save_header()
                     logging.info("AI has decided the mission is complete.");
-                    self.mission_history.append({"command": "finish_mission", "observation": action.tool_input});
+                    self._append_step(HistoryRecord.model_construct(command="finish_mission",
+                                                                    observation=action.tool_input));
                     break
 
-                filename, file_content = self.mcp_client.execute_command(action.tool_input)
-                observation = file_content or f"Command '{action.tool_input}' produced no output."
+                step = len(self.mission_history) + 1
+                with self.observation_store.record(step) as sink:
+                    pending_command = self.mcp_client.submit_command(action.tool_input, sink=sink)
+                    try:
+                        # The store's buffered earlier observations are flushed while the Kali server works.
+                        self.observation_store.flush()
+                        filename, result = pending_command.result()
+                    except BaseException:
+                        # Stop the worker writing to the sink before record() discards it.
+                        self.mcp_client.close()
+                        raise
+                    sink.filename = filename
+                # The pending assessment has been running alongside the command, so this rarely waits.
+                if self._apply_plan_status_update():
+                    self._save_header()
+                content_hash = raw_output = None
                 if filename:
-                    local_filepath = os.path.join(PROJECTS_DIR, filename)
-                    with open(local_filepath, 'w', encoding='utf-8') as f:
-                        f.write(observation)
-                    logging.info("Observation saved to '%s'", local_filepath)
+                    # The full output stays on disk; only a bounded excerpt is kept in memory. Empty outputs all
+                    # share one hash, so a silent command is deduplicated on its placeholder, which names it.
+                    content_hash = result["sha256"] if result["bytes"] else None
+                    observation = _excerpt(result) or f"Command '{action.tool_input}'{_NO_OUTPUT_SUFFIX}"
+                    # Recorded with the step, so the report can point at the full output behind the excerpt.
+                    raw_output = {"path": str(self.observation_store.data_path), "offset": sink.offset,
+                                  "length": sink.length}
+                    logging.info("Observation '%s' (%d bytes) stored in '%s'",
+                                 filename, result["bytes"], self.observation_store.data_path)
                 else:
+                    observation = result
                     logging.error("Command execution failed: %s", observation)
 
-                self.mission_history.append({"command": action.tool_input, "observation": observation})
-                self._update_plan_status()
-                self._save_state()
+                compact = self.thought_engine.compact_observation(observation, step, truncate=False,
+                                                                  content_hash=content_hash)
+                self._append_step(HistoryRecord.model_construct(command=action.tool_input, observation=observation,
+                                                                observation_compact=compact, raw_output=raw_output))
+                if self._should_update_plan(self.mission_history[-1]):
+                    self._start_plan_status_update()
 
                 if len(self.mission_history) >= 20: logging.warning("Max step limit (20) reached."); break
         except (APITimeoutError, KeyboardInterrupt) as e:
+            aborted = True
             logging.error("Mission aborted during execution loop: %s", e)
         finally:
+            try:
+                # An aborted run keeps only an assessment that has already finished.
+                if self._apply_plan_status_update(wait=not aborted):
+                    self._save_header()
+            except Exception as e:
+                logging.error("Final plan assessment failed: %s", e)
+            self.mcp_client.close()
+            self._wait_for_saves()
+            self._close_log()
+            self.observation_store.close()
             self._generate_final_report()
-            if os.path.exists(SESSION_FILE): os.remove(SESSION_FILE); logging.info("Session file cleaned up.")
+            self._clear_session()
+            logging.info("Session files cleaned up.")
 
     def _generate_final_report(self):
         logging.info("Generating final mission report...")
         if not self.mission_history: logging.warning("No actions were taken, cannot generate a report."); return
-        create_report(self.goal, self.mission_history)
\ No newline at end of file
+        final_finding = None
+        last = self.mission_history[-1]
+        if last.command == 'finish_mission':
+            # A failure finish carries a plain string; a successful one may carry a dict with key_finding.
+            final_finding = (last.observation if isinstance(last.observation, str)
+                             else last.observation.get('key_finding', "No summary provided."))
+        create_report(self.goal, self.mission_history, final_finding)
\ No newline at end of file
@@ -1,13 +1,19 @@
 # dawnyawn/agent/thought_engine.py (Final Version with Simplified Plan Update)
-import re
-import json
+import time
+import functools
+import hashlib
 import logging
-from pydantic import BaseModel
+import pathlib
+import threading
+from collections import OrderedDict
+import orjson
+from pydantic import BaseModel, TypeAdapter
 from pydantic_core import ValidationError
-from config import get_llm_client, LLM_MODEL_NAME, LLM_REQUEST_TIMEOUT
+from config import get_llm_client, LLM_MODEL_NAME, LLM_REQUEST_TIMEOUT, LLM_RESPONSE_CACHE_TTL, LLM_SEED
 from tools.tool_manager import ToolManager
 from models.task_node import TaskNode
-from typing import List, Dict
+from models.history_record import HistoryRecord
+from typing import List, Dict, Optional
 
 
 class ToolSelection(BaseModel):
@@ -20,22 +26,145 @@ class PlanUpdate(BaseModel):
     completed_task_ids: List[int]
 
 
+# Bump whenever a prompt template changes so cached responses from the old wording are not reused.
+PROMPT_VERSION = "v1"
+
+
+class _ResponseCache:
+    """Thread-safe LRU of validated LLM responses, keyed by a hash of the exact request.
+
+    With a `directory`, entries are also written there as JSON files so later runs can reuse them;
+    files older than the TTL are deleted when the cache is created and when an expired one is read.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = LLM_RESPONSE_CACHE_TTL,
+                 directory: Optional[pathlib.Path] = None):
+        self._entries: OrderedDict[str, tuple[float, BaseModel]] = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._directory = directory
+        self._lock = threading.Lock()
+        if directory is not None:
+            self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self._ttl
+        try:
+            for path in self._directory.glob("*.json"):
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                except OSError:
+                    pass  # Removed by a concurrent run, or unreadable; either way nothing to prune.
+        except OSError as e:
+            logging.warning("Could not prune LLM response cache: %s", e)
+
+    @staticmethod
+    def key(model: type[BaseModel], messages: List[Dict], temperature: float) -> str:
+        payload = orjson.dumps([PROMPT_VERSION, LLM_MODEL_NAME, model.__name__, temperature, messages])
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str, model: type[BaseModel]):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at <= self._ttl:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+        value = self._load(key, model)
+        if value is not None:
+            self.put(key, value, persist=False)
+        return value
+
+    def put(self, key: str, value: BaseModel, persist: bool = True):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        if persist and self._directory is not None:
+            try:
+                self._directory.mkdir(parents=True, exist_ok=True)
+                path = self._directory / f"{key}.json"
+                tmp_path = path.with_name(path.name + ".tmp")
+                tmp_path.write_text(value.model_dump_json(), encoding='utf-8')
+                tmp_path.replace(path)  # Atomic, so a half-written entry is never read.
+            except OSError as e:
+                logging.warning("Could not persist LLM response cache entry: %s", e)
+
+    def _load(self, key: str, model: type[BaseModel]):
+        if self._directory is None:
+            return None
+        path = self._directory / f"{key}.json"
+        try:
+            # Wall-clock mtime, since entries outlive the process.
+            if time.time() - path.stat().st_mtime > self._ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return model.model_validate_json(path.read_bytes())
+        except (OSError, ValidationError):
+            return None
+
+
+# Built once; validate_python on orjson-parsed dicts is cheaper than model_validate_json.
+# Only used on the fallback path when the client cannot return pre-parsed structured outputs.
+_TOOL_SELECTION_ADAPTER = TypeAdapter(ToolSelection)
+_PLAN_UPDATE_ADAPTER = TypeAdapter(PlanUpdate)
+
+
+@functools.lru_cache(maxsize=None)
+def _json_schema_format(model: type[BaseModel]) -> dict:
+    """response_format that constrains decoding to `model`'s JSON schema, built once per model."""
+    schema = model.model_json_schema()
+    schema["additionalProperties"] = False  # Required by strict mode; these models are flat.
+    return {"type": "json_schema", "json_schema": {"name": model.__name__, "schema": schema, "strict": True}}
+
+
 def _clean_json_response(response_str: str) -> str:
-    """Finds and extracts a JSON object from a string that might be wrapped in Markdown."""
-    match = re.search(r'\{.*\}', response_str, re.DOTALL)
-    if match:
-        return match.group(0)
-    return response_str
+    """Finds and extracts a JSON object or array from a string that might be wrapped in Markdown."""
+    # Fast path: schema-constrained decoding normally returns bare JSON.
+    if response_str.startswith('{') and response_str.endswith('}'):
+        return response_str
+    # Single forward scan for the first balanced {...} or [...]; no regex backtracking.
+    starts = [i for i in (response_str.find('{'), response_str.find('[')) if i >= 0]
+    if not starts:
+        return response_str
+    start = min(starts)
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(response_str)):
+        char = response_str[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return response_str[start:i + 1]
+    return response_str[start:]
 
 
-class ThoughtEngine:
-    """AI Reasoning component. Decides the next action and assesses plan status."""
+def _compact_observation(obs: str, head: int = 2048, tail: int = 1024) -> str:
+    """Keeps the head and tail of a long tool output so its prompt cost stays bounded."""
+    if len(obs) <= head + tail:
+        return obs
+    return f"{obs[:head]}\n…[{len(obs) - head - tail} bytes elided]…\n{obs[-tail:]}"
 
-    def __init__(self, tool_manager: ToolManager):
-        self.client = get_llm_client()
-        self.tool_manager = tool_manager
-        # This system prompt for choosing actions is now very solid.
-        self.system_prompt_template = f"""
+
+@functools.lru_cache(maxsize=1)
+def _system_prompt(manifest: str) -> str:
+    """Builds the action-selection system prompt once per manifest so every call sends identical text."""
+    return f"""
 You are an expert penetration tester and command-line AI. Your SOLE function is to output a single, valid JSON object that represents the next best command to execute.
 
 I. RESPONSE FORMATTING RULES (MANDATORY)
@@ -50,44 +179,180 @@ II. STRATEGIC ANALYSIS & COMMAND RULES (HOW TO THINK)
 4.  **DO NOT INSTALL ANY TOOL:**
 5.  **Learn from Failures:** If a command fails, do not repeat it. Choose a different command.
 6.  **Goal Completion:** Once all tasks in the plan are 'COMPLETED', you MUST use the `finish_mission` tool.
+7.  **Reuse Memory:** Check previous observations before proposing a new command; do not repeat commands that already succeeded.
 
 III. AVAILABLE TOOLS:
-{self.tool_manager.get_tool_manifest()}
+{manifest}
 """
 
-    def _format_plan(self, plan: List[TaskNode]) -> str:
-        if not plan: return "No plan provided."
-        return "\n".join([f"  - Task {task.task_id} [{task.status}]: {task.description}" for task in plan])
 
-    def choose_next_action(self, goal: str, plan: List[TaskNode], history: List[Dict]) -> ToolSelection:
-        logging.info("🤔 Thinking about the next step...")
+# Prompt form of an output byte-identical to an earlier step's; completed by that step's number.
+REPEATED_OBSERVATION_PREFIX = "[identical to observation #"
 
-        user_prompt = (
-            f"Based on the goal, plan, and history below, decide the single best command to execute next to progress on a PENDING task. Respond with a single, valid JSON object.\n\n"
-            f"**Main Goal:** {goal}\n\n"
-            f"**Strategic Plan:**\n{self._format_plan(plan)}\n\n"
-            f"**Execution History (most recent last):\n{json.dumps(history, indent=2)}"
-        )
+# Steps kept verbatim in the conversation. Older ones are folded into one-line summaries, but only once
+# 2 * HISTORY_WINDOW verbatim steps have built up, so the prompt prefix stays stable between folds.
+HISTORY_WINDOW = 8
+_SUMMARY_LINE_CHARS = 160
+
+
+_NEXT_ACTION_INSTRUCTION = ("Decide the single best command to execute next to progress on a PENDING task. "
+                            "Respond with a single, valid JSON object.")
+
+
+class ThoughtEngine:
+    """AI Reasoning component. Decides the next action and assesses plan status."""
+
+    def __init__(self, tool_manager: ToolManager, cache_dir: Optional[pathlib.Path] = None):
+        self.client = get_llm_client()
+        self.tool_manager = tool_manager
+        self.system_prompt_template = _system_prompt(self.tool_manager.get_tool_manifest())
+        # Rolling conversation: earlier turns are never rewritten, so the server can reuse its KV cache.
+        self._messages: List[Dict] = []
+        self._history_len_seen = 0
+        self._conversation_key: Optional[tuple] = None  # (goal, id of the history list) the conversation was built from.
+        self._summarized_upto = 0  # history[:_summarized_upto] appears only as one-line summaries.
+        self._obs_hashes: Dict[str, int] = {}  # Content hash of an output -> step number it first appeared at.
+        # Structured-output endpoint; older clients without it send the JSON schema and parse the content.
         try:
+            self._parse = self.client.beta.chat.completions.parse
+        except AttributeError:
+            self._parse = None
+        self._response_cache = _ResponseCache()
+        # Plan-status assessments depend only on the plan and the last command/output, which recur across
+        # missions (same whoami, same failed exec), so they are also kept on disk when a directory is given.
+        self._assessment_cache = _ResponseCache(directory=cache_dir)
+
+    def _complete_json(self, messages: List[Dict], model: type[BaseModel], adapter: TypeAdapter, temperature: float,
+                       cache: Optional[_ResponseCache] = None):
+        """Returns a response matching `model`, reusing a cached one when the exact request was seen before."""
+        cache = cache or self._response_cache
+        key = _ResponseCache.key(model, messages, temperature)
+        cached = cache.get(key, model)
+        if cached is not None:
+            logging.info("LLM response cache hit for %s.", model.__name__)
+            return cached
+        logging.info("LLM response cache miss for %s.", model.__name__)
+        result = self._request_json(messages, model, adapter, temperature)
+        cache.put(key, result)
+        return result
+
+    def _request_json(self, messages: List[Dict], model: type[BaseModel], adapter: TypeAdapter, temperature: float):
+        """Requests a response matching `model`, parsed by the client when it supports structured outputs."""
+        if self._parse is not None:
+            response = self._parse(model=LLM_MODEL_NAME, messages=messages, response_format=model,
+                                   timeout=LLM_REQUEST_TIMEOUT, temperature=temperature, seed=LLM_SEED)
+            message = response.choices[0].message
+            if message.parsed is not None:
+                return message.parsed
+            raw_response = message.content or ""
+        else:
             response = self.client.chat.completions.create(
                 model=LLM_MODEL_NAME,
-                messages=[{"role": "system", "content": self.system_prompt_template},
-                          {"role": "user", "content": user_prompt}],
+                messages=messages,
                 timeout=LLM_REQUEST_TIMEOUT,
-                response_format={"type": "json_object"},
-                temperature=0.2
+                response_format=_json_schema_format(model),
+                temperature=temperature,
+                seed=LLM_SEED
             )
             raw_response = response.choices[0].message.content
-            selection = ToolSelection.model_validate_json(_clean_json_response(raw_response))
+        # Cold path, for backends that ignore the schema: pull the JSON object out of free-form text.
+        return adapter.validate_python(orjson.loads(_clean_json_response(raw_response)))
+
+    def _format_plan(self, plan: List[TaskNode]) -> str:
+        if not plan: return "No plan provided."
+        return "\n".join([f"  - Task {task.task_id} [{task.status}]: {task.description}" for task in plan])
+
+    def compact_observation(self, observation: str, step: int, truncate: bool = True,
+                            content_hash: Optional[str] = None) -> str:
+        """Returns the prompt form of a step's observation, collapsing exact repeats to a back-reference.
+
+        Pass truncate=False for observations that are already a bounded excerpt, and the full output's
+        `content_hash` when one is known, so outputs differing only in the elided middle stay distinct.
+        """
+        digest = content_hash or hashlib.blake2b(observation.encode('utf-8', errors='ignore'), digest_size=16).hexdigest()
+        first_step = self._obs_hashes.setdefault(digest, step)
+        if first_step != step:
+            return f"{REPEATED_OBSERVATION_PREFIX}{first_step}]"
+        return _compact_observation(observation) if truncate else observation
+
+    @staticmethod
+    def _prompt_observation(item: HistoryRecord) -> str:
+        if item.observation_compact is not None:
+            return item.observation_compact
+        return _compact_observation(str(item.observation))
+
+    def _format_history(self, history: List[HistoryRecord], start: int = 0) -> str:
+        """Renders earlier steps as one block, used when resuming a mission with existing history."""
+        parts = []
+        for i, item in enumerate(history, start):
+            parts.append(f"Action {i + 1}:\n  - Command: `{item.command}`\n"
+                         f"  - Observation:\n```\n{self._prompt_observation(item)}\n```")
+        return "\n".join(parts)
+
+    def _summarize_history(self, history: List[HistoryRecord]) -> str:
+        """One line per step (command and the first line of its output) for steps outside the verbatim window."""
+        lines = []
+        for i, item in enumerate(history):
+            first_line = next((line.strip() for line in self._prompt_observation(item).splitlines() if line.strip()),
+                              "(no output)")
+            lines.append(f"{i + 1}. `{item.command}` -> {first_line[:_SUMMARY_LINE_CHARS]}")
+        return "\n".join(lines)
+
+    def _sync_messages(self, goal: str, plan: List[TaskNode], history: List[HistoryRecord]):
+        """Appends only the history entries not yet in the conversation as assistant/observation turns.
+
+        The conversation is rebuilt only when the goal or history list changes, the history shrinks,
+        or enough verbatim steps have built up to fold the older ones into summaries.
+        """
+        conversation_key = (goal, id(history))
+        if (not self._messages or conversation_key != self._conversation_key
+                or len(history) < self._history_len_seen
+                or len(history) - self._summarized_upto > 2 * HISTORY_WINDOW):
+            self._summarized_upto = max(0, len(history) - HISTORY_WINDOW)
+            # Stable prefix first: the system prompt and goal are byte-identical across steps and runs,
+            # so the server's prompt cache can match them; the summary, plan and history come after.
+            state = ""
+            if self._summarized_upto:
+                state += f"**Earlier Steps (summary):**\n{self._summarize_history(history[:self._summarized_upto])}\n\n"
+            state += f"**Strategic Plan:**\n{self._format_plan(plan)}\n\n"
+            if len(history) > self._summarized_upto:
+                recent = self._format_history(history[self._summarized_upto:], start=self._summarized_upto)
+                state += f"**Execution History (most recent last):**\n{recent}\n\n"
+            self._messages = [
+                {"role": "system", "content": self.system_prompt_template},
+                {"role": "user", "content": f"**Main Goal:** {goal}"},
+                {"role": "user", "content": state + _NEXT_ACTION_INSTRUCTION},
+            ]
+            self._history_len_seen = len(history)
+            self._conversation_key = conversation_key
+
+        for item in history[self._history_len_seen:]:
+            action = {"tool_name": "os_command", "tool_input": item.command}
+            self._messages.append({"role": "assistant", "content": orjson.dumps(action).decode()})
+            self._messages.append({"role": "user", "content": f"**Observation:**\n{self._prompt_observation(item)}\n\n"
+                                                              f"**Strategic Plan:**\n{self._format_plan(plan)}\n\n"
+                                                              f"{_NEXT_ACTION_INSTRUCTION}"})
+        self._history_len_seen = len(history)
+
+    def choose_next_action(self, goal: str, plan: List[TaskNode], history: List[HistoryRecord]) -> ToolSelection:
+        logging.info("🤔 Thinking about the next step...")
+        self._sync_messages(goal, plan, history)
+        try:
+            selection = self._complete_json(self._messages, ToolSelection, _TOOL_SELECTION_ADAPTER, temperature=0.2)
             logging.info("AI's Next Action: %s", selection.tool_input)
             return selection
-        except (ValidationError, json.JSONDecodeError) as e:
+        except (ValidationError, orjson.JSONDecodeError) as e:
             logging.error("Critical Error during thought process: %s", type(e).__name__)
             return ToolSelection(tool_name="finish_mission",
                                  tool_input="Mission failed: The AI produced an invalid JSON response.")
 
+    def _format_last_action(self, history: List[HistoryRecord]) -> str:
+        if not history: return "No actions yet."
+        last = {"command": history[-1].command, "observation": self._prompt_observation(history[-1])}
+        return orjson.dumps(last, option=orjson.OPT_INDENT_2).decode()
+
     # --- THE FIX: This method is now much simpler for the AI ---
-    def get_completed_task_ids(self, goal: str, plan: List[TaskNode], history: List[Dict]) -> List[int]:
+    def get_completed_task_ids(self, goal: str, plan: List[TaskNode], history: List[HistoryRecord]) -> List[int]:
         """Asks the AI to identify which tasks are complete based on the latest action."""
         plan_update_prompt = (
             "You are a project manager AI. Review the strategic plan and the most recent entry in the execution history. "
@@ -95,20 +360,14 @@ III. AVAILABLE TOOLS:
             "Your response MUST be a single JSON object with one key: `\"completed_task_ids\"`, which is a list of integers. "
             "Example: `{\"completed_task_ids\": [1, 3]}`. If no tasks were completed, return an empty list.\n\n"
             f"**Strategic Plan:**\n{self._format_plan(plan)}\n\n"
-            f"**Most Recent Action & Observation:**\n{json.dumps(history[-1], indent=2) if history else 'No actions yet.'}"
+            f"**Most Recent Action & Observation:**\n{self._format_last_action(history)}"
         )
         try:
-            response = self.client.chat.completions.create(
-                model=LLM_MODEL_NAME,
-                messages=[{"role": "system", "content": "You are a JSON-only plan updating assistant."},
-                          {"role": "user", "content": plan_update_prompt}],
-                timeout=LLM_REQUEST_TIMEOUT,
-                response_format={"type": "json_object"},
-                temperature=0.0
-            )
-            raw_response = response.choices[0].message.content
-            update = PlanUpdate.model_validate_json(_clean_json_response(raw_response))
+            messages = [{"role": "system", "content": "You are a JSON-only plan updating assistant."},
+                        {"role": "user", "content": plan_update_prompt}]
+            update = self._complete_json(messages, PlanUpdate, _PLAN_UPDATE_ADAPTER, temperature=0.0,
+                                         cache=self._assessment_cache)
             return update.completed_task_ids
-        except (ValidationError, json.JSONDecodeError) as e:
+        except (ValidationError, orjson.JSONDecodeError) as e:
             logging.error("AI failed to identify completed tasks with valid JSON: %s", e)
             return []  # Return an empty list on failure
\ No newline at end of file
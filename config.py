@@ -1,5 +1,7 @@
 # dawnyawn/config.py
 import os
+import functools
+from dataclasses import dataclass
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -21,11 +23,28 @@ LLM_MODEL_NAME = os.getenv("LLM_MODEL")
 # Timeout for all LLM requests in seconds
 LLM_REQUEST_TIMEOUT = 600.0
 
+# Fixed sampling seed so identical prompts produce identical, cacheable completions
+LLM_SEED = 42
+
 # Maximum summary
 MAX_SUMMARY_INPUT_LENGTH = 5000
 
+# Seconds a cached strategic plan stays valid before the goal is replanned
+PLAN_CACHE_TTL = 7 * 24 * 3600.0
+
+# Seconds an identical LLM request may be answered from the response cache, in memory or on disk;
+# older files in the on-disk cache are deleted
+LLM_RESPONSE_CACHE_TTL = 7 * 24 * 3600.0
+
 # --- Service Configuration ---
+@dataclass(frozen=True, slots=True)
 class ServiceConfig:
-    KALI_DRIVER_URL: str = "http://127.0.0.1:1611"
+    KALI_DRIVER_URL: str
+
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> ServiceConfig:
+    """Reads the service settings from the environment once; every caller shares the same immutable snapshot."""
+    return ServiceConfig(KALI_DRIVER_URL=os.getenv("KALI_DRIVER_URL", "http://127.0.0.1:1611"))
 
-service_config = ServiceConfig()
\ No newline at end of file
+service_config = get_config()
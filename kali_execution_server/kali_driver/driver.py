@@ -1,16 +1,36 @@
 # kali_execution_server/kali_driver/driver.py (Final Logic Fix)
 import os
+import re
 import time
+import uuid
+import queue
+import socket
+import select
+import shlex
+import threading
 import docker
 import paramiko
-import tarfile
-from io import BytesIO
+from typing import Iterator
+
+# Per-channel flow-control window. paramiko's 2 MiB default makes a chatty scan stall on window
+# adjustments; a larger window lets the remote side keep sending while we drain.
+SSH_WINDOW_SIZE = 8 * 1024 * 1024
+
+# Trailing bytes held back from each streamed chunk in case they begin a sentinel split across reads.
+SENTINEL_HOLDBACK = 128
+
+
+def _as_script(command: str) -> str:
+    """Wraps a command so it runs in its own bash with stdin closed and stderr merged into stdout. Quoted as
+    one argument, no unbalanced quote or heredoc in the command can swallow the sentinel line after it."""
+    return f"bash -c {shlex.quote(command)} </dev/null 2>&1"
 
 
 class KaliContainer:
     def __init__(self, owner):
         self._owner = owner
         self._ssh_client = None
+        self._shell = None  # Long-lived interactive channel reused for every command.
 
         print("  [+] Creating Kali container from 'dawnyawn-kali-agent' image...")
         self._container = owner._docker_client.containers.create(
@@ -22,27 +42,37 @@ class KaliContainer:
 
         self.id = self._container.id
         self.short_id = self._container.short_id
+        self.uses = 0  # Commands run so far; the pool retires the container after a fixed number.
+        self.last_exit_status = None  # Set once a streamed command has finished.
+        self._host_port = None  # Host port mapped to the container's sshd; fixed for the container's lifetime.
 
         self._ensure_started()
         print(f"  [+] Container '{self.short_id}' created and running.")
 
+    def _inspect(self) -> dict:
+        """One low-level inspect call for both state and port mappings, on the manager's shared API client."""
+        inspect = self._owner._api.inspect_container(self.id)
+        port_data = (inspect["NetworkSettings"]["Ports"] or {}).get('22/tcp')
+        if port_data and 'HostPort' in port_data[0]:
+            self._host_port = int(port_data[0]['HostPort'])
+        return inspect
+
     def _ensure_started(self):
-        self._container.reload()
-        if self._container.status != "running":
+        if self._inspect()["State"]["Status"] != "running":
             self._container.start()
             time.sleep(2)
-        self._container.reload()
+            self._inspect()
 
     def _ensure_connected(self):
         if self._ssh_client and self._ssh_client.get_transport().is_active():
             return
 
-        self._container.reload()
-        port_data = self._container.ports.get('22/tcp')
-        if not port_data or 'HostPort' not in port_data[0]:
+        if self._host_port is None:
+            self._inspect()
+        if self._host_port is None:
             raise Exception(f"Failed to find mapped SSH port for container {self.id}")
 
-        public_port = int(port_data[0]['HostPort'])
+        public_port = self._host_port
         key_path = os.path.expanduser('~/.ssh/id_ecdsa')
         if not os.path.exists(key_path):
             raise FileNotFoundError(f"SSH private key not found at {key_path}.")
@@ -53,46 +83,141 @@ class KaliContainer:
             hostname='localhost', port=public_port, username='root',
             key_filename=key_path, timeout=30
         )
+        # Keep the idle connection alive between pooled jobs.
+        transport = self._ssh_client.get_transport()
+        transport.default_window_size = SSH_WINDOW_SIZE  # Applies to both the shell and exec fallback channels.
+        transport.set_keepalive(30)
+        transport.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Commands and sentinels are tiny writes; don't let Nagle hold them back.
+        transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._shell = None
 
-    # --- THE FIX: This method NO LONGER returns output. It just executes. ---
-    def send_command_and_get_output(self, command: str, timeout: int = 1800):
+    def _ensure_shell(self):
+        if self._shell is not None and not self._shell.closed and not self._shell.exit_status_ready():
+            return
         self._ensure_connected()
-        print(f"  [+] Sending command: '{command}'")
-        stdin, stdout, stderr = self._ssh_client.exec_command(command, timeout=timeout)
+        # Channel.invoke_shell requests no pty, so there is no echo, no prompt and no CR/LF rewriting:
+        # the channel carries only command output and our sentinels.
+        shell = self._ssh_client.get_transport().open_session()
+        shell.set_combine_stderr(True)
+        shell.invoke_shell()
+        self._shell = shell
+        for _ in self._stream_in_shell("true", timeout=30):
+            pass
+
+    def _close_shell(self):
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
 
-        # --- THE FIX: We now wait for the command to complete by checking the exit status. ---
-        # This is crucial because it blocks until the command is finished.
-        exit_status = stdout.channel.recv_exit_status()
-        print(f"  [+] Command finished with exit status: {exit_status}")
-        # We no longer read stdout/stderr here, as it's all in the file.
+    def _stream_in_shell(self, command: str, timeout: int) -> Iterator[bytes]:
+        """Runs a command on the persistent shell, yielding its output as it arrives until the sentinel reports the exit status."""
+        token = uuid.uuid4().hex
+        # The printf format keeps the literal sentinel out of the command text itself.
+        sentinel = re.compile(rb"__DONE_" + token.encode() + rb"__ (\d+)\n")
+        self._shell.sendall(f"{_as_script(command)}\nprintf '__DONE_%s__ %d\\n' {token} $?\n".encode())
 
-    def copy_file_from_container(self, path: str) -> str:
-        """Copies a file from the container and returns its content as a string."""
+        buf = bytearray()
+        finished = False
+        deadline = time.monotonic() + timeout
         try:
-            bits, stat = self._container.get_archive(path)
-
-            with BytesIO() as f:
-                for chunk in bits:
-                    f.write(chunk)
-                f.seek(0)
-                with tarfile.open(fileobj=f) as tar:
-                    member = tar.getmembers()[0]
-                    extracted_file = tar.extractfile(member)
-                    return extracted_file.read().decode('utf-8', errors='ignore')
-        except docker.errors.NotFound:
-            # If the command produced no output file, return a string indicating that.
-            return f"Command produced no output file at '{path}'."
-        except IndexError:
-            # If the tarball is empty, it means the file was not created.
-            return f"Command produced no output file at '{path}'."
+            while True:
+                match = sentinel.search(buf)
+                if match:
+                    finished = True
+                    self.last_exit_status = int(match.group(1))
+                    if match.start():
+                        yield bytes(buf[:match.start()])
+                    return
+                # Hold back only what could be the start of a sentinel split across reads.
+                if len(buf) > SENTINEL_HOLDBACK:
+                    yield bytes(buf[:-SENTINEL_HOLDBACK])
+                    del buf[:-SENTINEL_HOLDBACK]
+                if self._shell.closed or self._shell.exit_status_ready():
+                    # The shell itself went away (e.g. killed); its status is all there is.
+                    self.last_exit_status = self._shell.exit_status if self._shell.exit_status_ready() else -1
+                    self._close_shell()
+                    finished = True
+                    if buf:
+                        yield bytes(buf)
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Command did not finish within {timeout}s: '{command}'")
+                readable, _, _ = select.select([self._shell], [], [], min(remaining, 1.0))
+                if readable:
+                    buf += self._shell.recv(65536)
+        finally:
+            if not finished:
+                self._close_shell()  # Timed out or abandoned mid-command; the next command gets a fresh shell.
+
+    def _exec_fallback(self, command: str, timeout: int) -> tuple[int, bytes, bytes]:
+        """Runs a command on a one-off exec channel, draining stdout and stderr together so neither pipe can fill and stall the remote process."""
+        stdin, stdout, stderr = self._ssh_client.exec_command(_as_script(command), timeout=timeout)
+        stdin.close()
+        channel = stdout.channel
+        out, err = bytearray(), bytearray()
+        deadline = time.monotonic() + timeout
+        while True:
+            while channel.recv_ready():
+                out += channel.recv(65536)
+            while channel.recv_stderr_ready():
+                err += channel.recv_stderr(65536)
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                channel.close()
+                raise TimeoutError(f"Command did not finish within {timeout}s: '{command}'")
+            select.select([channel], [], [], min(remaining, 1.0))
+        # Anything still buffered after the exit status arrived.
+        out += stdout.read()
+        err += stderr.read()
+        return channel.recv_exit_status(), bytes(out), bytes(err)
+
+    def stream_command(self, command: str, timeout: int = 1800) -> Iterator[bytes]:
+        """Yields the command's output straight off the SSH channel; `last_exit_status` is set once it is exhausted."""
+        print(f"  [+] Sending command: '{command}'")
+        self.last_exit_status = None
+        try:
+            self._ensure_shell()
+        except (paramiko.SSHException, OSError, TimeoutError) as e:
+            # No interactive shell could be opened; fall back to a one-off exec channel.
+            print(f"  [!] Interactive shell unavailable ({e}); falling back to exec_command.")
+            self._close_shell()
+            self._ensure_connected()
+            self.last_exit_status, out, err = self._exec_fallback(command, timeout)
+            if out or err:
+                yield out + err
+        else:
+            yield from self._stream_in_shell(command, timeout)
+        print(f"  [+] Command finished with exit status: {self.last_exit_status}")
+
+    # Returns the exit status and the command's full output.
+    def send_command_and_get_output(self, command: str, timeout: int = 1800) -> tuple[int, str]:
+        output = b"".join(self.stream_command(command, timeout))
+        return self.last_exit_status, output.decode('utf-8', errors='ignore')
+
+    def reset(self):
+        """Returns the container to a clean state between pooled jobs."""
+        # Remove job workdirs and kill anything a previous command left running (except sshd, PID 1, this script
+        # and the persistent shell that started it).
+        # sshd is matched by prefix: OpenSSH 9.8+ serves each connection from a separate `sshd-session` process.
+        self.send_command_and_get_output(
+            "rm -rf /tmp/dawn_*; "
+            "for p in $(ps -eo pid=,comm= | awk '$2 !~ /^sshd/ && $1 != 1 {print $1}'); do "
+            "[ \"$p\" != \"$$\" ] && [ \"$p\" != \"$PPID\" ] && kill -9 \"$p\" 2>/dev/null; done; true",
+            timeout=30
+        )
 
     def destroy(self):
+        self._close_shell()
         if self._ssh_client:
             self._ssh_client.close()
         try:
-            self._container.reload()
+            status = self._inspect()["State"]["Status"]
             print(f"\n  [+] Cleaning up container '{self.short_id}'...")
-            if self._container.status in ["running", "created"]:
+            if status in ["running", "created"]:
                 self._container.stop()
             self._container.remove(force=True)
             print("  [+] Cleanup complete.")
@@ -101,13 +226,66 @@ class KaliContainer:
 
 
 class KaliManager:
-    def __init__(self):
+    """Keeps a warm pool of ready Kali containers so requests skip container start-up and SSH handshakes."""
+
+    def __init__(self, pool_size: int = 2, max_uses: int = 20):
         try:
-            self._docker_client = docker.from_env()
+            # Sized so every pooled container plus the replenisher can talk to the daemon without queueing.
+            self._docker_client = docker.from_env(max_pool_size=max(10, pool_size + 2))
             self._docker_client.ping()
+            self._api = self._docker_client.api  # Low-level client sharing the same connection pool.
         except Exception as e:
             print("FATAL ERROR: Could not connect to Docker. Is it running?")
             raise e
 
+        self._pool_size = pool_size
+        self._max_uses = max_uses
+        self._idle: "queue.Queue[KaliContainer]" = queue.Queue()
+        self._refill_requests: "queue.Queue[None]" = queue.Queue()
+        for _ in range(pool_size):
+            self._idle.put(self.create_container())
+        threading.Thread(target=self._replenish, name="kali-pool-replenisher", daemon=True).start()
+
     def create_container(self) -> "KaliContainer":
-        return KaliContainer(owner=self)
\ No newline at end of file
+        return KaliContainer(owner=self)
+
+    def _replenish(self):
+        """Background loop that replaces every retired container with a fresh one."""
+        while True:
+            self._refill_requests.get()
+            try:
+                self._idle.put(self.create_container())
+            except Exception as e:
+                print(f"  [!] Failed to replenish container pool: {e}")
+                time.sleep(5)
+                self._refill_requests.put(None)
+
+    def acquire(self) -> "KaliContainer":
+        """Takes a warm container from the pool, creating one on the spot if the pool is exhausted."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            print("  [!] Container pool exhausted; creating a container on demand.")
+            return self.create_container()
+
+    def release(self, container: "KaliContainer"):
+        """Resets a used container and returns it to the pool, or retires it once it has run max_uses jobs."""
+        container.uses += 1
+        if container.uses < self._max_uses and self._idle.qsize() < self._pool_size:
+            try:
+                container.reset()
+                self._idle.put(container)
+                return
+            except Exception as e:
+                print(f"  [!] Failed to reset container '{container.short_id}': {e}")
+        container.destroy()
+        if self._idle.qsize() < self._pool_size:
+            self._refill_requests.put(None)
+
+    def shutdown(self):
+        """Destroys every idle container in the pool."""
+        while True:
+            try:
+                self._idle.get_nowait().destroy()
+            except queue.Empty:
+                return
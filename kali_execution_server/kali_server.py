@@ -2,8 +2,11 @@
 import uvicorn
 import uuid
 import os
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 # Local Imports
@@ -15,59 +18,93 @@ class ExecuteRequest(BaseModel):
     command: str
 
 
-class ExecuteResponse(BaseModel):
-    filename: str
-    file_content: str
-
-
 # --- FastAPI App Setup ---
 app = FastAPI(title="DawnYawn Ephemeral Execution Server")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] (ExecutionServer) - %(message)s")
 
-logging.info("Initializing Kali Docker Manager...")
-kali_manager = KaliManager()
+# Warm containers kept ready, and how many commands one container serves before it is replaced.
+POOL_SIZE = int(os.getenv("KALI_POOL_SIZE", "2"))
+MAX_USES_PER_CONTAINER = int(os.getenv("KALI_MAX_USES_PER_CONTAINER", "20"))
+
+logging.info("Initializing Kali Docker Manager with a pool of %d containers...", POOL_SIZE)
+kali_manager = KaliManager(pool_size=POOL_SIZE, max_uses=MAX_USES_PER_CONTAINER)
 logging.info("Kali Docker Manager initialized.")
 
+# Docker and SSH calls block, so they run here; one worker per pooled container lets that many commands run at once.
+executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="kali-exec")
+
 
-@app.post("/execute", response_model=ExecuteResponse)
-def execute_command(request: ExecuteRequest):
+def _finish_stream(container: KaliContainer, chunks):
+    """Stops the command stream and returns the container to the pool."""
+    chunks.close()
+    logging.info("--- [CLEANUP] Returning container %s to the pool ---", container.id[:12])
+    kali_manager.release(container)
+
+
+@app.post("/execute")
+async def execute_command(request: ExecuteRequest):
     """
-    Creates a new container, runs a single command, extracts the output
-    to a file, and destroys the container.
+    Takes a warm container from the pool, runs a single command in a fresh
+    workdir, streams its output back as it is produced, and hands the
+    container back once the stream ends. The output name is sent in the
+    X-Filename header.
     """
-    container: KaliContainer = None
+    loop = asyncio.get_running_loop()
     command = request.command
 
     sanitized_command = "".join(c for c in command if c.isalnum() or c in (' ', '_', '-')).rstrip()
     unique_id = uuid.uuid4().hex[:6]
     output_filename = f"{sanitized_command.replace(' ', '_')}_{unique_id}.txt"
-    output_filepath_in_container = f"/tmp/{output_filename}"
+    workdir = f"/tmp/dawn_{unique_id}"
 
     logging.info("--- [EXECUTE] New request for command: '%s' ---", command)
+    container: KaliContainer = None
     try:
-        container = kali_manager.create_container()
-        # --- FINAL FIX: Use the simple '.id' attribute we added to the KaliContainer class ---
-        logging.info("Created temporary container: %s", container.id[:12])
-
-        full_command_with_redirect = f"{command} > {output_filepath_in_container} 2>&1"
-        container.send_command_and_get_output(full_command_with_redirect, timeout=1800)
-
-        # NOTE: This assumes you have a 'copy_file_from_container' method in your driver.
-        # If not, that will be the next error we need to implement.
-        file_content = container.copy_file_from_container(output_filepath_in_container)
-
-        logging.info("--- ✅ Command executed, result captured in '%s' ---", output_filename)
-        return ExecuteResponse(filename=output_filename, file_content=file_content)
-
+        container = await loop.run_in_executor(executor, kali_manager.acquire)
+        logging.info("Acquired pooled container: %s", container.id[:12])
+
+        # The driver runs this as one quoted bash script, with stdin closed and stderr merged.
+        full_command = f"mkdir -p {workdir} && cd {workdir} && {command}"
+        chunks = container.stream_command(full_command, timeout=1800)
+        # The first chunk is pulled before responding so start-up failures still surface as a 500.
+        first_chunk = await loop.run_in_executor(executor, next, chunks, None)
     except Exception as e:
         logging.error("--- ❌ Command execution failed: %s ---", e, exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Command execution failed on server: {e}")
-    finally:
         if container:
-            # --- FINAL FIX: Use the simple '.id' attribute ---
-            logging.info("--- [CLEANUP] Destroying container %s ---", container.id[:12])
-            container.destroy()
+            await loop.run_in_executor(executor, kali_manager.release, container)
+        raise HTTPException(status_code=500, detail=f"Command execution failed on server: {e}")
+
+    async def body():
+        pending = None
+        try:
+            chunk = first_chunk
+            while chunk is not None:
+                yield chunk
+                pending = executor.submit(next, chunks, None)
+                chunk = await asyncio.wrap_future(pending)
+            logging.info("--- ✅ Command executed, result streamed as '%s' ---", output_filename)
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in-band.
+            logging.error("--- ❌ Command execution failed mid-stream: %s ---", e, exc_info=True)
+            yield f"\nCommand execution failed on server: {e}\n".encode()
+        finally:
+            # Not awaited: on a client disconnect this runs while the task is being cancelled. Cleanup is
+            # chained onto any in-flight read rather than waiting for it, so no worker is parked meanwhile.
+            cleanup = lambda _: executor.submit(_finish_stream, container, chunks)
+            if pending is None:
+                cleanup(None)
+            else:
+                pending.add_done_callback(cleanup)
+
+    return StreamingResponse(body(), media_type="text/plain; charset=utf-8", headers={"X-Filename": output_filename})
+
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    executor.shutdown(wait=True)
+    kali_manager.shutdown()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=1611)
\ No newline at end of file
+    # uvicorn drops idle connections after 5s by default; agents think for longer than that between commands.
+    uvicorn.run(app, host="127.0.0.1", port=1611, timeout_keep_alive=120)
\ No newline at end of file
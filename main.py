@@ -1,28 +1,56 @@
 # dawnyawn/main.py (Final Version with Resume Logic)
 import os
+import queue
+import pathlib
+import atexit
 import argparse
 import logging
-from dotenv import load_dotenv
+import logging.handlers
 from agent.task_manager import TaskManager
 
+# Resolved once at import.
+LOGS_DIR = pathlib.Path(__file__).resolve().parent / "logs"
+
+
 def setup_logging():
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    logs_dir = os.path.join(project_root, 'logs')
-    os.makedirs(logs_dir, exist_ok=True)
-    log_filepath = os.path.join(logs_dir, 'agent_run.log')
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] [%(name)s] - %(message)s",
-        handlers=[
-            logging.FileHandler(log_filepath, mode='w'), # 'w' for overwrite on new run
-            logging.StreamHandler()
-        ]
+    root_logger = logging.getLogger()
+    # Re-entry (tests, a REPL) must not stack a second queue and listener onto the root logger.
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root_logger.handlers):
+        return
+
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    log_filepath = LOGS_DIR / 'agent_run.log'
+
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] - %(message)s")
+    file_handler = logging.FileHandler(log_filepath, mode='w')  # 'w' for overwrite on new run
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    stream_handler.setLevel(logging.INFO)
+    # File writes are batched; anything at ERROR or above is flushed to disk at once.
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=256, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True
+    )
+    # The level sits on the buffer: MemoryHandler.flush hands records to its target without a level check.
+    buffered_file_handler.setLevel(logging.INFO)
+
+    # The agent thread only enqueues records; a listener thread formats and writes them.
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, buffered_file_handler, stream_handler, respect_handler_level=True
     )
+    listener.start()
+    atexit.register(buffered_file_handler.close)
+    atexit.register(listener.stop)  # Registered last so it runs first and drains the queue.
+
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    # Connection-pool chatter from the keep-alive session would otherwise be logged on every request.
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 def main():
     setup_logging()
-    load_dotenv()
+    # .env is loaded once, when config is imported (via TaskManager above).
     if not os.getenv("OLLAMA_BASE_URL") or not os.getenv("LLM_MODEL"):
         logging.critical("FATAL ERROR: OLLAMA_BASE_URL or LLM_MODEL not found in .env file.")
         return
@@ -0,0 +1,16 @@
+# dawnyawn/models/history_record.py
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Optional, Union
+
+
+class HistoryRecord(BaseModel):
+    """One executed step of a mission: the command and what it produced."""
+    command: str
+    observation: Union[str, dict]
+    observation_compact: Optional[str] = Field(None, description="Bounded, deduplicated form of the observation used in prompts.")
+    raw_output: Optional[dict] = Field(None, description="Where the full output is kept when `observation` is an excerpt: "
+                                                         "the store's data file `path`, payload `offset` and `length`.")
+
+
+# Built once so whole histories are validated and serialized by pydantic-core in a single pass.
+HIST_ADAPTER = TypeAdapter(list[HistoryRecord])
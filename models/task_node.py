@@ -1,5 +1,5 @@
 # dawnyawn/models/task_node.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import Optional
 from enum import Enum
 
@@ -20,4 +20,8 @@ class TaskNode(BaseModel):
     summary: Optional[str] = None
 
     class Config:
-        use_enum_values = True
\ No newline at end of file
+        use_enum_values = True
+
+# Built once so a whole plan is validated and serialized by pydantic-core in a single pass,
+# without wrapping the list in a model first.
+PLAN_ADAPTER = TypeAdapter(list[TaskNode])
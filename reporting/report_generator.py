@@ -1,68 +1,82 @@
 # dawnyawn/reporting/report_generator.py (Corrected for String Observation)
-import os
 import logging
+import pathlib
+import orjson
 from datetime import datetime
-from typing import List, Dict
+from typing import Iterable, Optional
+from models.history_record import HistoryRecord
 
-# Define the project root relative to this file's location
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Resolved once at import, relative to this file's location
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
 # Correctly point to the Reports directory inside the Projects folder
-REPORTS_DIR = os.path.join(PROJECT_ROOT, "Projects", "Reports")
+REPORTS_DIR = PROJECT_ROOT / "Projects" / "Reports"
 
+# Text report sections, filled with str.format.
+_HEADER_TMPL = ("--- DAWNYAWN MISSION REPORT ---\n" + "=" * 35 + "\n\n"
+                "Mission Goal: {goal}\n"
+                "Report Generated: {generated}\n\n"
+                "--- EXECUTION LOG ---\n" + "=" * 21 + "\n\n")
+_STEP_TMPL = ("Step {i}:\n" + "-" * 10 + "\n"
+              "  Action Command:\n    `{command}`\n\n"
+              "  Observation:\n    {observation}\n\n")
+_RAW_OUTPUT_TMPL = "  Full Output:\n    {length} bytes at offset {offset} of `{path}`\n\n"
+_SUMMARY_TMPL = "--- FINAL SUMMARY ---\n" + "=" * 21 + "\n\n{final_finding}\n"
+_NO_STEPS = "No actions were executed during this mission.\n"
+_NO_FINISH = "Mission did not conclude with a `finish_mission` command."
 
-def create_report(goal: str, history: List[Dict]):
-    """Generates a professional text report from the mission history."""
-    try:
-        os.makedirs(REPORTS_DIR, exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_filename = f"report_{timestamp}.txt"
-        report_filepath = os.path.join(REPORTS_DIR, report_filename)
-
-        with open(report_filepath, 'w', encoding='utf-8') as f:
-            f.write("--- DAWNYAWN MISSION REPORT ---\n")
-            f.write("=" * 35 + "\n\n")
-            f.write(f"Mission Goal: {goal}\n")
-            f.write(f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("--- EXECUTION LOG ---\n")
-            f.write("=" * 21 + "\n\n")
-
-            if not history:
-                f.write("No actions were executed during this mission.\n")
-            else:
-                for i, item in enumerate(history):
-                    f.write(f"Step {i + 1}:\n")
-                    f.write("-" * 10 + "\n")
-                    f.write(f"  Action Command:\n    `{item.get('command', 'N/A')}`\n\n")
-                    f.write("  Observation:\n")
-
-                    obs_text = item.get('observation', 'No observation recorded.')
-                    if not isinstance(obs_text, str):
-                        obs_text = str(obs_text)
 
-                    indented_obs = "    " + obs_text.replace('\n', '\n    ')
-                    f.write(indented_obs)
-                    f.write("\n\n")
+def create_report(goal: str, history: Iterable[HistoryRecord], final_finding: Optional[str] = None) -> Optional[pathlib.Path]:
+    """Generates the mission report: a canonical JSON-lines log plus the human-readable text view of it.
 
-            f.write("--- FINAL SUMMARY ---\n")
-            f.write("=" * 21 + "\n\n")
+    `history` is consumed once, step by step, so it may be a generator. `final_finding` is the
+    mission's concluding summary; None means the mission did not finish via `finish_mission`.
+    Returns the text report's path, or None if it could not be written.
+    """
+    try:
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-            # --- THE FIX: Handle both string and dict observations for the final step ---
-            final_finding = "Mission did not conclude with a `finish_mission` command."
-            if history and history[-1].get('command') == 'finish_mission':
-                final_observation = history[-1].get('observation')
-                # If the observation is a simple string (from a failure), just use it.
-                if isinstance(final_observation, str):
-                    final_finding = final_observation
-                # If it's a dictionary (from a successful finish), get the key_finding.
-                elif isinstance(final_observation, dict):
-                    final_finding = final_observation.get('key_finding', "No summary provided.")
+        now = datetime.now()  # One clock read for both the filename and the header, so they always agree.
+        log_filepath = REPORTS_DIR / f"report_{now.strftime('%Y%m%d_%H%M%S')}.jsonl"
 
-            f.write(f"{final_finding}\n")
+        # Line 1 is the mission header; every further line is one step. Streamed into a 64 KiB buffer.
+        with open(log_filepath, 'wb', buffering=1 << 16) as f:
+            f.write(orjson.dumps({"goal": goal, "generated": now.strftime('%Y-%m-%d %H:%M:%S'),
+                                  "final_finding": final_finding}) + b"\n")
+            for item in history:
+                f.write(item.model_dump_json(include={"command", "observation", "raw_output"},
+                                             exclude_none=True).encode('utf-8') + b"\n")
 
+        report_filepath = render_text_report(log_filepath)
         logging.info("✅ Professional report generated at: %s", report_filepath)
+        return report_filepath
 
     except IOError as e:
         logging.error("Failed to write report file: %s", e)
     except Exception as e:
-        logging.error("An unexpected error occurred during report generation: %s", e, exc_info=True)
\ No newline at end of file
+        logging.error("An unexpected error occurred during report generation: %s", e, exc_info=True)
+    return None
+
+
+def render_text_report(log_filepath: str | pathlib.Path) -> pathlib.Path:
+    """Renders a report log written by create_report as the text report next to it; returns its path."""
+    report_filepath = pathlib.Path(log_filepath).with_suffix(".txt")
+    with open(log_filepath, 'rb') as log, open(report_filepath, 'w', buffering=1 << 16, encoding='utf-8') as f:
+        header = orjson.loads(log.readline())
+        f.write(_HEADER_TMPL.format(goal=header["goal"], generated=header["generated"]))
+
+        step_count = 0
+        for step_count, line in enumerate(log, 1):
+            item = orjson.loads(line)
+            # Observations are strings, or a dict for a structured finish; str() is a no-op on the former.
+            obs_text = str(item["observation"]) if item["observation"] else 'No observation recorded.'
+            f.write(_STEP_TMPL.format(i=step_count, command=item["command"],
+                                      observation=obs_text.replace('\n', '\n    ')))
+            if item.get("raw_output"):
+                # The observation is an excerpt; this is where the whole output can be read back.
+                f.write(_RAW_OUTPUT_TMPL.format(**item["raw_output"]))
+        if not step_count:
+            f.write(_NO_STEPS)
+
+        final_finding = header["final_finding"]
+        f.write(_SUMMARY_TMPL.format(final_finding=_NO_FINISH if final_finding is None else final_finding))
+    return report_filepath
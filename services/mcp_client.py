@@ -1,25 +1,165 @@
 # dawnyawn/services/mcp_client.py (NEW Simplified Version)
+import hashlib
+import logging
+import orjson
 import requests
-from typing import Tuple
-from config import service_config
+import threading
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Tuple, Optional, BinaryIO
+from config import get_config
+
+# Sizes of the output excerpt kept in memory when the full output is streamed to a sink.
+SUMMARY_HEAD_BYTES = 2048
+SUMMARY_TAIL_BYTES = 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+_CANCELLED = "Execution cancelled: the agent is shutting down."
+
+logger = logging.getLogger(__name__)
+
+
+class _OutputDigest:
+    """Accumulates byte count, SHA256 and head/tail excerpts of an output without keeping all of it."""
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self._bytes = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def update(self, chunk: bytes):
+        self._sha256.update(chunk)
+        self._bytes += len(chunk)
+        if len(self._head) < SUMMARY_HEAD_BYTES:
+            self._head += chunk[:SUMMARY_HEAD_BYTES - len(self._head)]
+        self._tail = (self._tail + chunk)[-SUMMARY_TAIL_BYTES:]
+
+    def summary(self) -> dict:
+        tail_len = max(0, min(SUMMARY_TAIL_BYTES, self._bytes - len(self._head)))  # Never overlap the head.
+        tail = self._tail[len(self._tail) - tail_len:]
+        elided = self._bytes - len(self._head) - tail_len
+        if elided == 0:
+            # Nothing was dropped, so decode it as one buffer; a character split at the head boundary survives.
+            head, tail = (self._head + tail).decode('utf-8', errors='ignore'), ""
+        else:
+            head, tail = self._head.decode('utf-8', errors='ignore'), tail.decode('utf-8', errors='ignore')
+        return {
+            "bytes": self._bytes,
+            "sha256": self._sha256.hexdigest(),
+            "head": head,
+            "tail": tail,
+            "elided": elided,
+        }
+
+
+def _error_detail(body: bytes) -> Optional[str]:
+    """Pulls FastAPI's `detail` message out of an error body, parsed with orjson straight from bytes."""
+    try:
+        detail = orjson.loads(body).get("detail")
+    except (orjson.JSONDecodeError, AttributeError):
+        return None
+    return detail if isinstance(detail, str) else None
+
 
 class McpClient:
     """Handles communication with the ephemeral execution server."""
 
-    def execute_command(self, command: str) -> Tuple[str, str]:
+    def __init__(self):
+        self._execute_url = f"{get_config().KALI_DRIVER_URL}/execute"  # Built once, not per call.
+        # One keep-alive session for the whole mission, so each step reuses a pooled connection.
+        self._session = requests.Session()
+        # Transient failures are retried inside urllib3 with exponential backoff. POST is opted in only for
+        # connect errors and gateway 502/503/504s, where the request did not get through to the server. Read
+        # and other mid-request errors are not retried: by then the command may already be running in a
+        # container. The server's own 500 is not retried either, and the final response is returned rather
+        # than raised, so its detail is kept.
+        retry = Retry(total=3, read=0, other=0, backoff_factor=0.3, status_forcelist=[502, 503, 504],
+                      allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=retry)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # Set once for every request. /execute answers in plain text; errors come back as JSON.
+        self._session.headers.update({"Connection": "keep-alive", "Keep-Alive": "timeout=120, max=1000",
+                                      "Accept": "text/plain, application/json"})
+        # Responses still being read, so close() can cut them off. Sink writes happen under the same lock,
+        # so once close() returns no worker writes to a sink again.
+        self._lock = threading.Lock()
+        self._responses = set()
+        self._closed = False
+
+    def close(self):
+        """Aborts in-flight commands and releases the pooled connections."""
+        with self._lock:
+            self._closed = True
+            responses = list(self._responses)
+        for response in responses:
+            response.close()
+        self._session.close()
+
+    def submit_command(self, command: str, sink: Optional[BinaryIO] = None) -> "Future[Tuple[str, str | dict]]":
+        """Starts execute_command in the background; the future resolves to the same (filename, result) pair."""
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.execute_command(command, sink))
+            except BaseException as e:
+                future.set_exception(e)
+        # A daemon thread, unlike an executor worker, is not joined at interpreter exit, so a
+        # long-running command cannot hold up Ctrl+C.
+        threading.Thread(target=run, name="mcp-client", daemon=True).start()
+        return future
+
+    def execute_command(self, command: str, sink: Optional[BinaryIO] = None) -> Tuple[str, str | dict]:
         """
         Executes a command and returns the output filename and its content.
+        If `sink` is given, the output is written to it instead and a summary dict
+        (byte count, SHA256, head and tail excerpts, elided byte count) is returned in place of the content.
         Returns (None, error_message) on failure.
         """
         try:
-            response = requests.post(
-                f"{service_config.KALI_DRIVER_URL}/execute",
+            with self._session.post(
+                self._execute_url,
                 json={"command": command},
+                stream=True,
                 timeout=1800  # Long timeout for potentially long commands
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["filename"], data["file_content"]
+            ) as response:
+                with self._lock:
+                    if self._closed:
+                        return None, _CANCELLED
+                    self._responses.add(response)
+                try:
+                    return self._read_output(command, response, sink)
+                finally:
+                    with self._lock:
+                        self._responses.discard(response)
         except requests.exceptions.RequestException as e:
+            logger.warning("Execution request for '%s' failed: %s", command, e)
             error_msg = f"Agent-side connection error: {e}"
-            return None, error_msg
\ No newline at end of file
+            return None, error_msg
+
+    def _read_output(self, command: str, response: requests.Response,
+                     sink: Optional[BinaryIO]) -> Tuple[str, str | dict]:
+        if response.status_code >= 400:
+            detail = _error_detail(response.content)
+            if detail:
+                logger.warning("Execution server rejected '%s': %s", command, detail)
+                return None, detail
+        response.raise_for_status()
+        # The server streams raw output and names it in a header, so nothing is JSON-decoded here.
+        filename = response.headers.get("X-Filename")
+        chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        if sink is None:
+            return filename, b"".join(chunks).decode('utf-8', errors='ignore')
+
+        digest = _OutputDigest()
+        for chunk in chunks:
+            with self._lock:
+                if self._closed:
+                    return None, _CANCELLED
+                sink.write(chunk)
+            digest.update(chunk)
+        return filename, digest.summary()
@@ -0,0 +1,128 @@
+# dawnyawn/services/observation_store.py
+import os
+import struct
+import pathlib
+import contextlib
+import orjson
+from typing import Iterator
+
+# Buffered bytes are only handed to the OS once they pass this size (or on close).
+FLUSH_THRESHOLD = 256 * 1024
+# A record larger than this stops being held in memory and streams straight into the data file.
+SPILL_THRESHOLD = 64 * 1024
+
+
+class ObservationRecord:
+    """Writable sink for a single observation. Set `filename` to keep the record; leave it None to discard it."""
+
+    def __init__(self, data_fh, start: int):
+        self.filename: str | None = None
+        self.length = 0
+        self.offset: int | None = None  # Payload offset in the data file, set once the record is committed.
+        self._data_fh = data_fh
+        self._start = start
+        self._buffer = bytearray()
+        self._spilled = False
+
+    def write(self, data: bytes) -> int:
+        self.length += len(data)
+        if self._spilled:
+            self._data_fh.write(data)
+        else:
+            self._buffer += data
+            if len(self._buffer) > SPILL_THRESHOLD:
+                # Reserve the length prefix; it is patched in once the size is known.
+                self._data_fh.write(b'\0\0\0\0')
+                self._data_fh.write(self._buffer)
+                self._buffer = bytearray()
+                self._spilled = True
+        return len(data)
+
+
+class ObservationStore:
+    """Append-only store that keeps every raw tool observation in one length-prefixed file.
+
+    Each record in `observations.bin` is a little-endian uint32 length followed by the UTF-8
+    payload. `observations.idx` holds one JSON line per record mapping the step to its offset.
+    """
+
+    def __init__(self, directory: pathlib.Path):
+        self.data_path = pathlib.Path(directory) / "observations.bin"
+        self.index_path = pathlib.Path(directory) / "observations.idx"
+        self._data_fh = None
+        self._index_fh = None
+        self._offset = 0
+        self._pending = 0
+
+    def _open(self):
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        # Opened read/write rather than append-only so a streamed record's length prefix can be patched.
+        fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._data_fh = open(fd, 'r+b', buffering=1 << 20)
+        self._offset = self._data_fh.seek(0, os.SEEK_END)
+        self._index_fh = open(self.index_path, 'ab', buffering=64 * 1024)
+
+    @contextlib.contextmanager
+    def record(self, step: int) -> Iterator[ObservationRecord]:
+        """Yields a sink for one observation; it is committed on exit if its filename was set."""
+        if self._data_fh is None:
+            self._open()
+        start = self._offset
+        record = ObservationRecord(self._data_fh, start)
+        try:
+            yield record
+        except BaseException:
+            self._discard(record)
+            raise
+        if record.filename is None:
+            self._discard(record)
+            return
+
+        if record._spilled:
+            end = start + 4 + record.length
+            self._data_fh.seek(start)
+            self._data_fh.write(struct.pack('<I', record.length))
+            self._data_fh.seek(end)
+        else:
+            self._data_fh.write(struct.pack('<I', record.length) + record._buffer)
+        self._offset = start + 4 + record.length
+        record.offset = start + 4
+        self._index_fh.write(orjson.dumps({"step": step, "filename": record.filename,
+                                           "offset": start + 4, "length": record.length}) + b'\n')
+        self._pending += 4 + record.length
+        if self._pending >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def _discard(self, record: ObservationRecord):
+        if record._spilled:
+            self._data_fh.seek(record._start)
+            self._data_fh.truncate()
+
+    def append(self, step: int, filename: str, content: str) -> int:
+        """Buffers one observation and returns the offset of its payload in the data file."""
+        with self.record(step) as record:
+            record.write(content.encode('utf-8'))
+            record.filename = filename
+        return record.offset
+
+    def read(self, offset: int, length: int) -> str:
+        """Reads back a payload recorded by `append`."""
+        self.flush()
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length).decode('utf-8')
+
+    def flush(self):
+        """Hands buffered records to the OS. Safe while a streamed record is being written from another thread,
+        since the buffered file serialises flushes with writes."""
+        if self._data_fh is not None:
+            self._data_fh.flush()
+            self._index_fh.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._data_fh is not None:
+            self.flush()
+            self._data_fh.close()
+            self._index_fh.close()
+            self._data_fh = self._index_fh = None
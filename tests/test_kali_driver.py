@@ -0,0 +1,91 @@
+# dawnyawn/tests/test_kali_driver.py
+import re
+import types
+import pytest
+
+pytest.importorskip("docker")
+pytest.importorskip("paramiko")
+import kali_execution_server.kali_driver.driver as driver_module
+from kali_execution_server.kali_driver.driver import KaliContainer
+
+
+class _FakeShell:
+    """Stands in for the persistent SSH shell channel. `script(token)` returns the bytes the shell
+    sends back, split into reads; with `exit_status` set, the channel closes once they are drained."""
+
+    def __init__(self, script, exit_status: int | None = None):
+        self._script = script
+        self._reads = []
+        self._exit_status = exit_status
+        self.sent = b""
+        self.closed = False
+        self.exit_status = exit_status
+
+    def sendall(self, data: bytes):
+        self.sent += data
+        token = re.search(rb"printf '__DONE_%s__ %d\\n' (\w+) \$\?", data).group(1).decode()
+        self._reads = list(self._script(token))
+
+    def recv(self, size: int) -> bytes:
+        return self._reads.pop(0)
+
+    def exit_status_ready(self) -> bool:
+        return self._exit_status is not None and not self._reads
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def container(monkeypatch):
+    """A KaliContainer with no Docker container behind it; select() reports the fake shell readable when it has data."""
+    monkeypatch.setattr(driver_module, "select", types.SimpleNamespace(
+        select=lambda r, w, x, timeout: (r if r[0]._reads else [], [], [])))
+    container = KaliContainer.__new__(KaliContainer)
+    container.last_exit_status = None
+    return container
+
+
+def _split(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_sentinel_split_across_reads(container):
+    """Tests that a sentinel arriving in pieces is recognised, and output ahead of it streams before it completes."""
+    output = b"".join(b"line %d\n" % i for i in range(100))
+    container._shell = _FakeShell(lambda token: _split(output + f"__DONE_{token}__ 3\n".encode(), 7))
+
+    chunks = list(container._stream_in_shell("cat lines", timeout=5))
+    assert b"".join(chunks) == output
+    assert len(chunks) > 1
+    assert container.last_exit_status == 3
+    assert container._shell.sent.startswith(b"bash -c 'cat lines' </dev/null 2>&1\n")
+
+
+def test_output_without_trailing_newline(container):
+    """Tests that the sentinel is found when the command's last line has no newline of its own."""
+    container._shell = _FakeShell(lambda token: [b"no newline", f"__DONE_{token}__ 0\n".encode()])
+
+    assert b"".join(container._stream_in_shell("printf 'no newline'", timeout=5)) == b"no newline"
+    assert container.last_exit_status == 0
+    assert container._shell is not None
+
+
+def test_shell_closing_mid_command(container):
+    """Tests that a shell which dies before the sentinel yields what it sent and reports the shell's status."""
+    shell = _FakeShell(lambda token: [b"partial output"], exit_status=137)
+    container._shell = shell
+
+    assert b"".join(container._stream_in_shell("sleep 100", timeout=5)) == b"partial output"
+    assert container.last_exit_status == 137
+    assert shell.closed and container._shell is None
+
+
+def test_timeout_discards_the_shell(container):
+    """Tests that a command outliving its timeout raises, and the shell is dropped so the next command gets a fresh one."""
+    shell = _FakeShell(lambda token: [])
+    container._shell = shell
+
+    with pytest.raises(TimeoutError):
+        list(container._stream_in_shell("sleep 100", timeout=0))
+    assert shell.closed and container._shell is None
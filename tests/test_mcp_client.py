@@ -0,0 +1,98 @@
+# dawnyawn/tests/test_mcp_client.py
+import io
+import requests
+from services.mcp_client import McpClient
+
+
+class _FakeStreamedResponse:
+    """Stands in for a streamed requests response from the execution server."""
+
+    def __init__(self, body: bytes, filename: str, status_code: int = 200):
+        self.headers = {"X-Filename": filename}
+        self.status_code = status_code
+        self.content = body
+        self._body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._body), chunk_size):
+            yield self._body[i:i + chunk_size]
+
+
+def test_streamed_output_reaches_sink(monkeypatch):
+    """
+    Tests that a streamed response is written to the sink chunk by chunk,
+    named from the X-Filename header, and summarised without the full text.
+    """
+    body = b"Nmap scan report\n" * 10_000
+    client = McpClient()
+    monkeypatch.setattr(client._session, "post",
+                        lambda *args, **kwargs: _FakeStreamedResponse(body, "nmap_abc123.txt"))
+
+    sink = io.BytesIO()
+    filename, summary = client.execute_command("nmap example.com", sink=sink)
+    assert filename == "nmap_abc123.txt"
+    assert sink.getvalue() == body
+    assert summary["bytes"] == len(body)
+
+    filename, content = client.execute_command("nmap example.com")
+    assert content == body.decode()
+
+    filename, content = client.submit_command("nmap example.com").result()
+    assert content == body.decode()
+
+
+def test_connection_error_is_reported(monkeypatch):
+    """Tests that transport failures come back as (None, error message) instead of raising."""
+    def refuse(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+    client = McpClient()
+    monkeypatch.setattr(client._session, "post", refuse)
+
+    filename, message = client.execute_command("whoami")
+    assert filename is None
+    assert message.startswith("Agent-side connection error")
+
+
+def test_server_error_detail_becomes_the_observation(monkeypatch):
+    """Tests that a 500 from the execution server surfaces its JSON detail instead of a bare HTTP error."""
+    client = McpClient()
+    body = b'{"detail": "Command execution failed on server: container pool exhausted"}'
+    monkeypatch.setattr(client._session, "post",
+                        lambda *args, **kwargs: _FakeStreamedResponse(body, "", status_code=500))
+
+    filename, message = client.execute_command("whoami")
+    assert filename is None
+    assert message == "Command execution failed on server: container pool exhausted"
+
+
+def test_close_stops_writes_to_the_sink(monkeypatch):
+    """Tests that once close() returns, a command still streaming writes nothing more to its sink."""
+    client = McpClient()
+    response = _FakeStreamedResponse(b"x" * 200_000, "big.txt")
+    chunks = response.iter_content
+
+    def close_after_first_chunk(chunk_size):
+        for i, chunk in enumerate(chunks(chunk_size)):
+            if i == 1:
+                client.close()
+            yield chunk
+    response.iter_content = close_after_first_chunk
+    monkeypatch.setattr(client._session, "post", lambda *args, **kwargs: response)
+
+    sink = io.BytesIO()
+    filename, message = client.submit_command("cat big.txt", sink=sink).result()
+    assert filename is None
+    assert message.startswith("Execution cancelled")
+    assert len(sink.getvalue()) == 64 * 1024
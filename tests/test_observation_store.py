@@ -0,0 +1,49 @@
+# dawnyawn/tests/test_observation_store.py
+from services.observation_store import ObservationStore
+
+
+def test_append_and_read_back(tmp_path):
+    """
+    Tests that length-prefixed records can be read back from the offsets
+    returned by append, including across a reopened store.
+    """
+    store = ObservationStore(tmp_path)
+    first = store.append(1, "ping_abc123.txt", "4 packets received")
+    second = store.append(2, "whois_def456.txt", "Registrar: Exämple")
+    store.close()
+
+    reopened = ObservationStore(tmp_path)
+    third = reopened.append(1, "dig_789abc.txt", "93.184.216.34")
+    assert reopened.read(first, len("4 packets received")) == "4 packets received"
+    assert reopened.read(second, len("Registrar: Exämple".encode())) == "Registrar: Exämple"
+    assert reopened.read(third, len("93.184.216.34")) == "93.184.216.34"
+    reopened.close()
+
+    index_lines = (tmp_path / "observations.idx").read_bytes().splitlines()
+    assert len(index_lines) == 3
+
+
+def test_streamed_record_and_discard(tmp_path):
+    """
+    Tests that a record larger than the spill threshold streams to disk with
+    a patched length prefix, and that a record without a filename is dropped.
+    """
+    from services.observation_store import SPILL_THRESHOLD
+    store = ObservationStore(tmp_path)
+    big = b"x" * (SPILL_THRESHOLD * 3 + 7)
+
+    with store.record(1) as record:
+        for i in range(0, len(big), 4096):
+            record.write(big[i:i + 4096])
+        record.filename = "nmap_abc123.txt"
+    big_offset = store._offset - record.length
+
+    with store.record(2) as dropped:
+        dropped.write(b"y" * (SPILL_THRESHOLD * 2))
+
+    small_offset = store.append(3, "id_def456.txt", "uid=0(root)")
+    assert store.read(big_offset, len(big)) == big.decode()
+    assert store.read(small_offset, len("uid=0(root)")) == "uid=0(root)"
+    store.close()
+
+    assert (tmp_path / "observations.bin").stat().st_size == 4 + len(big) + 4 + len("uid=0(root)")
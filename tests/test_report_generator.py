@@ -0,0 +1,46 @@
+# dawnyawn/tests/test_report_generator.py
+import reporting.report_generator as report_generator_module
+from reporting.report_generator import create_report
+from models.history_record import HistoryRecord
+
+
+def test_report_lists_steps_and_final_finding(tmp_path, monkeypatch):
+    """
+    Tests that every step's command and indented observation appear in
+    order, followed by the finish_mission text as the final summary.
+    """
+    monkeypatch.setattr(report_generator_module, "REPORTS_DIR", tmp_path)
+    history = [HistoryRecord(command="id", observation="uid=0(root)\ngid=0(root)"),
+               HistoryRecord(command="finish_mission", observation="Host is reachable.")]
+    report_path = create_report("Check example.com", iter(history), final_finding="Host is reachable.")
+
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".jsonl", ".txt"]
+    text = open(report_path, encoding="utf-8").read()
+    assert text.startswith("--- DAWNYAWN MISSION REPORT ---\n")
+    assert "Mission Goal: Check example.com\n" in text
+    assert "Step 1:\n----------\n  Action Command:\n    `id`\n\n  Observation:\n    uid=0(root)\n    gid=0(root)\n\n" in text
+    assert text.index("Step 1:") < text.index("Step 2:")
+    assert text.endswith("--- FINAL SUMMARY ---\n" + "=" * 21 + "\n\nHost is reachable.\n")
+
+
+def test_report_without_finish_mission(tmp_path, monkeypatch):
+    """Tests the fallback summary when the mission stopped without finish_mission."""
+    monkeypatch.setattr(report_generator_module, "REPORTS_DIR", tmp_path)
+    report_path = create_report("Check example.com", [HistoryRecord(command="id", observation="uid=0(root)")])
+
+    assert open(report_path, encoding="utf-8").read().endswith(
+        "Mission did not conclude with a `finish_mission` command.\n")
+
+
+def test_text_report_renders_from_the_log(tmp_path, monkeypatch):
+    """Tests that the text view can be re-rendered from the JSON-lines log alone, with identical output."""
+    monkeypatch.setattr(report_generator_module, "REPORTS_DIR", tmp_path)
+    history = [HistoryRecord(command="whois example.com", observation="Registrar: Exämple"),
+               HistoryRecord(command="finish_mission", observation={"key_finding": "Registrar found."})]
+    report_path = create_report("Check example.com", history, final_finding="Registrar found.")
+    original = open(report_path, encoding="utf-8").read()
+
+    (log_path,) = tmp_path.glob("*.jsonl")
+    assert report_generator_module.render_text_report(str(log_path)) == report_path
+    assert open(report_path, encoding="utf-8").read() == original
+    assert "    {'key_finding': 'Registrar found.'}\n" in original
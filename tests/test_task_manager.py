@@ -0,0 +1,286 @@
+# dawnyawn/tests/test_task_manager.py
+import threading
+import pytest
+from concurrent.futures import Future
+import agent.task_manager as task_manager_module
+import reporting.report_generator as report_generator_module
+from agent.task_manager import TaskManager, TaskManagerOptions
+from agent.thought_engine import ToolSelection
+from services.mcp_client import _OutputDigest
+from models.task_node import TaskNode, TaskStatus
+from models.history_record import HistoryRecord
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """A TaskManager whose session files live in a temporary directory."""
+    monkeypatch.setattr(task_manager_module, "SESSION_FILE", tmp_path / "mission_session.json")
+    monkeypatch.setattr(task_manager_module, "SESSION_LOG", tmp_path / "mission_session.json.log")
+    monkeypatch.setattr(task_manager_module, "PLAN_CACHE_DIR", tmp_path / "plan_cache")
+    monkeypatch.setattr(task_manager_module, "LLM_CACHE_DIR", tmp_path / "llm_cache")
+    monkeypatch.setattr(task_manager_module, "OBSERVATIONS_DIR", tmp_path / "observations")
+    return TaskManager(goal="Ping example.com")
+
+
+def test_session_round_trip(manager):
+    """
+    Tests that the plan header and the append-only step log are
+    replayed into an identical mission state on resume.
+    """
+    manager.plan = [TaskNode(task_id=1, description="Ping the host."),
+                    TaskNode(task_id=2, description="Report the result.")]
+    manager.plan[0].status = TaskStatus.COMPLETED
+    manager._save_header()
+    manager._append_step(HistoryRecord(command="ping -c 4 example.com", observation="4 packets received"))
+    manager._append_step(HistoryRecord(command="whois example.com", observation="Registrar: Example"))
+    manager._wait_for_saves()
+    manager._close_log()
+
+    resumed = TaskManager(goal="Ping example.com")
+    assert resumed._load_state()
+    assert [task.status for task in resumed.plan] == [TaskStatus.COMPLETED, TaskStatus.PENDING]
+    assert resumed.mission_history == manager.mission_history
+    assert resumed.observation_store.data_path == manager.observation_store.data_path
+
+
+def test_load_state_rejects_other_goal(manager):
+    """Tests that a session saved for a different goal is discarded."""
+    manager.plan = [TaskNode(task_id=1, description="Ping the host.")]
+    manager._save_header()
+    manager._append_step(HistoryRecord(command="ping -c 4 example.com", observation="ok"))
+    manager._wait_for_saves()
+    manager._close_log()
+
+    other = TaskManager(goal="Something else")
+    assert not other._load_state()
+    assert not task_manager_module.SESSION_LOG.exists()
+
+
+def test_load_state_discards_corrupt_session(manager):
+    """Tests that an unreadable session is removed, so the fresh mission does not append to it."""
+    manager.plan = [TaskNode(task_id=1, description="Ping the host.")]
+    manager._save_header()
+    manager._wait_for_saves()
+    task_manager_module.SESSION_LOG.write_bytes(b'{"command": "ping"\n')
+
+    resumed = TaskManager(goal="Ping example.com")
+    assert not resumed._load_state()
+    assert not task_manager_module.SESSION_FILE.exists()
+    assert not task_manager_module.SESSION_LOG.exists()
+
+
+def test_plan_cache_round_trip_and_ttl(manager, monkeypatch):
+    """Tests that a cached plan is reused for the same goal and ignored once expired."""
+    assert manager._load_cached_plan() == []
+    manager.plan = [TaskNode(task_id=1, description="Ping the host.")]
+    manager._cache_plan()
+
+    assert TaskManager(goal="Ping example.com")._load_cached_plan() == manager.plan
+    assert TaskManager(goal="Something else")._load_cached_plan() == []
+
+    monkeypatch.setattr(task_manager_module, "PLAN_CACHE_TTL", -1)
+    assert manager._load_cached_plan() == []
+
+
+def test_declined_plan_is_not_cached(manager, monkeypatch):
+    """Tests that a plan the user turned down is not reused on the next run."""
+    plan = [TaskNode(task_id=1, description="Ping the host.")]
+    monkeypatch.setattr(manager.scheduler, "create_plan", lambda goal: plan)
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    manager.run()
+    assert manager._load_cached_plan() == []
+
+    manager._cache_plan()
+    manager.run()
+    assert manager._load_cached_plan() == []
+
+
+def test_should_update_plan_gate(manager):
+    """
+    Tests that the plan-status check is skipped for failed or unrelated
+    commands, and forced once STATUS_CHECK_INTERVAL steps have passed.
+    """
+    manager.plan = [TaskNode(task_id=1, description="Run whois on example.com to find the registrar.")]
+    assert not manager._should_update_plan(HistoryRecord(command="nmapx", observation="bash: nmapx: command not found"))
+    assert not manager._should_update_plan(HistoryRecord(command="ls -la", observation="whois.txt"))
+    assert not manager._should_update_plan(HistoryRecord(command="whois example.com", observation=" \n"))
+    assert not manager._should_update_plan(HistoryRecord(command="whois example.com",
+                                                         observation="Command 'whois example.com' produced no output."))
+    assert not manager._should_update_plan(HistoryRecord(command="ping -c 4 exmaple.invalid",
+                                                         observation="ping: exmaple.invalid: Name or service not known"))
+    assert manager._should_update_plan(HistoryRecord(command="whois example.com", observation="Registrar: Example"))
+    assert not manager._should_update_plan(HistoryRecord(command="whois example.com", observation="Registrar: Example",
+                                                         observation_compact="[identical to observation #2]"))
+
+    manager._steps_since_status_check = 0
+    unrelated = HistoryRecord(command="ping -c 4 10.0.0.1", observation="4 packets received")
+    checks = [manager._should_update_plan(unrelated) for _ in range(task_manager_module.STATUS_CHECK_INTERVAL)]
+    assert checks == [False] * (task_manager_module.STATUS_CHECK_INTERVAL - 1) + [True]
+
+    # A no-op word only skips a simple command; chained work is still assessed.
+    manager._steps_since_status_check = 0
+    assert manager._should_update_plan(HistoryRecord(command="cd /tmp && whois example.com",
+                                                     observation="Registrar: Example"))
+    assert not manager._should_update_plan(HistoryRecord(command="sleep 5", observation="done"))
+
+    # Skipped steps still count toward the forced check.
+    manager._steps_since_status_check = 0
+    for _ in range(task_manager_module.STATUS_CHECK_INTERVAL):
+        assert not manager._should_update_plan(HistoryRecord(command="ls", observation="a.txt"))
+    assert manager._should_update_plan(unrelated)
+
+
+def test_plan_status_update_runs_in_background(manager, monkeypatch):
+    """
+    Tests that an assessment is computed on snapshots of the plan and history
+    and only changes the live plan once it is applied.
+    """
+    manager.plan = [TaskNode(task_id=1, description="Ping the host."),
+                    TaskNode(task_id=2, description="Report the result.")]
+    manager.mission_history = [HistoryRecord(command="ping -c 4 example.com", observation="4 packets received")]
+    seen = {}
+
+    def fake_assessment(goal, plan, history):
+        seen["plan"], seen["history"] = plan, history
+        return [1]
+    monkeypatch.setattr(manager.thought_engine, "get_completed_task_ids", fake_assessment)
+
+    manager._start_plan_status_update()
+    manager._pending_status.result()
+    assert manager.plan[0].status == TaskStatus.PENDING
+    assert manager._apply_plan_status_update()
+    assert manager.plan[0].status == TaskStatus.COMPLETED
+    assert seen["plan"][0] is not manager.plan[0]
+    assert seen["history"] is not manager.mission_history
+    assert not manager._apply_plan_status_update()
+    # No new step since the assessment was submitted, so the gate stays closed.
+    assert not manager._should_update_plan(manager.mission_history[-1])
+
+
+def test_aborted_run_drops_unfinished_assessment(manager, monkeypatch):
+    """Tests that an abort does not wait on an assessment still in flight, and that it cannot block exit."""
+    manager.plan = [TaskNode(task_id=1, description="Ping the host.")]
+    manager.mission_history = [HistoryRecord(command="ping -c 4 example.com", observation="4 packets received")]
+    release = threading.Event()
+    monkeypatch.setattr(manager.thought_engine, "get_completed_task_ids",
+                        lambda goal, plan, history: release.wait(5) and [1])
+
+    manager._start_plan_status_update()
+    worker = next(t for t in threading.enumerate() if t.name == "plan-status")
+    assert worker.daemon
+    assert not manager._apply_plan_status_update(wait=False)
+    assert manager.plan[0].status == TaskStatus.PENDING
+    assert manager._pending_status is None
+    release.set()
+
+def test_disabled_session_file_writes_nothing(manager):
+    """Tests that use_session_file=False keeps history in memory only."""
+    ephemeral = TaskManager(goal="Ping example.com", options=TaskManagerOptions(use_session_file=False))
+    ephemeral.plan = [TaskNode(task_id=1, description="Ping the host.")]
+    ephemeral._save_header()
+    ephemeral._append_step(HistoryRecord(command="ping -c 4 example.com", observation="ok"))
+    ephemeral._wait_for_saves()
+
+    assert len(ephemeral.mission_history) == 1
+    assert not task_manager_module.SESSION_FILE.exists()
+    assert not task_manager_module.SESSION_LOG.exists()
+
+
+@pytest.mark.parametrize("size", [10, 2048 + 500, 50_000])
+def test_excerpt_from_streamed_summary(size):
+    """Tests that the in-memory excerpt of a streamed output never duplicates or loses the edges."""
+    from services.mcp_client import _OutputDigest
+    output = bytes(ord("a") + i % 26 for i in range(size))
+    digest = _OutputDigest()
+    for i in range(0, size, 1000):
+        digest.update(output[i:i + 1000])
+    summary = digest.summary()
+
+    excerpt = task_manager_module._excerpt(summary)
+    assert summary["bytes"] == size
+    if size <= 2048 + 1024:
+        assert excerpt == output.decode()
+    else:
+        assert excerpt.startswith(output[:2048].decode())
+        assert excerpt.endswith(output[-1024:].decode())
+        assert f"[{size - 3072} bytes elided]" in excerpt
+
+
+@pytest.mark.parametrize("size", [2059, 50_000])
+def test_excerpt_keeps_multibyte_text_at_the_head_boundary(size):
+    """Tests that a character split across the head/tail boundary is kept, and the elided count stays in bytes."""
+    from services.mcp_client import _OutputDigest
+    output = ("a" * 2047 + "é" + "b" * (size - 2049)).encode()
+    digest = _OutputDigest()
+    for i in range(0, size, 1000):
+        digest.update(output[i:i + 1000])
+
+    excerpt = task_manager_module._excerpt(digest.summary())
+    if size <= 2048 + 1024:
+        assert excerpt == output.decode()
+    else:
+        assert f"[{size - 3072} bytes elided]" in excerpt
+
+
+def _run_mission(manager, monkeypatch, tmp_path, outputs: dict[str, bytes]):
+    """Runs the mission loop with the LLM and the execution server stubbed; each command prints outputs[command]."""
+    monkeypatch.setattr(report_generator_module, "REPORTS_DIR", tmp_path / "reports")
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    monkeypatch.setattr(manager.scheduler, "create_plan", lambda goal: [TaskNode(task_id=1, description="Ping it.")])
+    actions = iter([ToolSelection(tool_name="os_command", tool_input=command) for command in outputs]
+                   + [ToolSelection(tool_name="finish_mission", tool_input="Done.")])
+    monkeypatch.setattr(manager.thought_engine, "choose_next_action", lambda goal, plan, history: next(actions))
+    monkeypatch.setattr(manager.thought_engine, "get_completed_task_ids", lambda goal, plan, history: [])
+
+    def submit_command(command, sink):
+        digest = _OutputDigest()
+        sink.write(outputs[command])
+        digest.update(outputs[command])
+        future = Future()
+        future.set_result((f"{command.split()[0]}.txt", digest.summary()))
+        return future
+    monkeypatch.setattr(manager.mcp_client, "submit_command", submit_command)
+    manager.run()
+
+
+def test_silent_commands_are_not_deduplicated_against_each_other(manager, monkeypatch, tmp_path):
+    """Tests that two different commands with no output keep their own placeholders in the prompt."""
+    _run_mission(manager, monkeypatch, tmp_path, {"touch a": b"", "touch b": b"", "id": b"uid=0(root)\n"})
+
+    compacts = [entry.observation_compact for entry in manager.mission_history[:3]]
+    assert compacts == ["Command 'touch a' produced no output.", "Command 'touch b' produced no output.",
+                        "uid=0(root)\n"]
+
+
+def test_each_mission_has_its_own_observation_store(manager, monkeypatch, tmp_path):
+    """Tests that a second mission's steps never share the first one's data file or index."""
+    _run_mission(manager, monkeypatch, tmp_path, {"id": b"uid=0(root)\n"})
+    other = TaskManager(goal="Ping example.com")
+    _run_mission(other, monkeypatch, tmp_path, {"whoami": b"root\n"})
+
+    assert other.observation_store.data_path != manager.observation_store.data_path
+    assert other.observation_store.index_path.read_bytes().count(b'"step":1') == 1
+
+
+def test_report_points_at_the_full_output(manager, monkeypatch, tmp_path):
+    """Tests that a step whose observation is only an excerpt records where its full output can be read back."""
+    output = b"".join(b"port %d open\n" % i for i in range(10_000))
+    _run_mission(manager, monkeypatch, tmp_path, {"nmap example.com": output})
+
+    raw_output = manager.mission_history[0].raw_output
+    assert "bytes elided" in manager.mission_history[0].observation
+    assert manager.observation_store.read(raw_output["offset"], raw_output["length"]) == output.decode()
+    (report,) = (tmp_path / "reports").glob("*.txt")
+    assert f"{len(output)} bytes at offset {raw_output['offset']} of `{raw_output['path']}`" in report.read_text()
+
+
+def test_new_mission_truncates_a_stale_session_log(manager, monkeypatch, tmp_path):
+    """Tests that steps left in SESSION_LOG by an earlier run never reach the new mission's log."""
+    task_manager_module.SESSION_LOG.write_bytes(b'{"command":"stale","observation":"old"}\n')
+    appended = []
+    monkeypatch.setattr(manager, "_clear_session", lambda: appended.extend(
+        task_manager_module.SESSION_LOG.read_bytes().splitlines()))
+    _run_mission(manager, monkeypatch, tmp_path, {"id": b"uid=0(root)\n"})
+
+    assert [line for line in appended if b"stale" in line] == []
+    assert len(appended) == 2  # The id step and finish_mission.
@@ -0,0 +1,210 @@
+# dawnyawn/tests/test_thought_engine.py
+import pytest
+from agent.thought_engine import ThoughtEngine
+from tools.tool_manager import ToolManager
+from models.task_node import TaskNode
+from models.history_record import HistoryRecord
+
+
+@pytest.fixture
+def engine():
+    return ThoughtEngine(ToolManager())
+
+
+def test_sync_messages_appends_only_new_turns(engine):
+    """
+    Tests that each call extends the rolling conversation with the newest
+    history entry only, leaving earlier turns byte-for-byte unchanged.
+    """
+    plan = [TaskNode(task_id=1, description="Ping the host.")]
+    history = []
+    engine._sync_messages("Ping example.com", plan, history)
+    assert [m["role"] for m in engine._messages] == ["system", "user", "user"]
+    assert engine._messages[1]["content"] == "**Main Goal:** Ping example.com"
+
+    history.append(HistoryRecord(command="ping -c 4 example.com", observation="4 packets received"))
+    engine._sync_messages("Ping example.com", plan, history)
+    first_turns = list(engine._messages)
+    assert [m["role"] for m in first_turns] == ["system", "user", "user", "assistant", "user"]
+    assert "4 packets received" in first_turns[-1]["content"]
+
+    history.append(HistoryRecord(command="whois example.com", observation="Registrar: Example"))
+    engine._sync_messages("Ping example.com", plan, history)
+    assert engine._messages[:5] == first_turns
+    assert len(engine._messages) == 7
+
+
+def test_sync_messages_rebuilds_for_a_different_history(engine):
+    """Tests that a replaced history list of the same length rebuilds the conversation instead of reusing stale turns."""
+    plan = [TaskNode(task_id=1, description="Ping the host.")]
+    history = [HistoryRecord(command="ping -c 4 example.com", observation="4 packets received")]
+    engine._sync_messages("Ping example.com", plan, history)
+    engine._sync_messages("Ping example.com", plan, history)
+    assert len(engine._messages) == 3
+
+    other = [HistoryRecord(command="whois example.com", observation="Registrar: Example")]
+    engine._sync_messages("Ping example.com", plan, other)
+    assert len(engine._messages) == 3
+    assert "whois example.com" in engine._messages[2]["content"]
+    assert "ping -c 4" not in engine._messages[2]["content"]
+
+
+def test_compact_observation_bounds_and_dedups(engine):
+    """Tests that long outputs keep only head and tail, and repeats become back-references."""
+    long_output = "A" * 5000 + "B" * 5000
+    compact = engine.compact_observation(long_output, step=1)
+    assert compact.startswith("A" * 2048)
+    assert compact.endswith("B" * 1024)
+    assert "[6928 bytes elided]" in compact
+
+    assert engine.compact_observation(long_output, step=3) == "[identical to observation #1]"
+    assert engine.compact_observation("short", step=4) == "short"
+    # Same excerpt, different full output: the content hash keeps them apart.
+    assert engine.compact_observation("head…tail", step=5, content_hash="aa") == "head…tail"
+    assert engine.compact_observation("head…tail", step=6, content_hash="bb") == "head…tail"
+    assert engine.compact_observation("head…tail", step=7, content_hash="aa") == "[identical to observation #5]"
+
+
+def test_clean_json_response_extracts_object():
+    """Tests JSON extraction from bare, Markdown-wrapped and prose-wrapped responses."""
+    from agent.thought_engine import _clean_json_response
+    bare = '{"tool_name": "os_command", "tool_input": "id"}'
+    assert _clean_json_response(bare) == bare
+    assert _clean_json_response(f"```json\n{bare}\n```") == bare
+    assert _clean_json_response('Sure! {"a": {"b": 1}} and {"c": 2}') == '{"a": {"b": 1}}'
+    assert _clean_json_response("no json here") == "no json here"
+
+
+def test_sync_messages_seeds_resumed_history_as_one_block(engine):
+    """Tests that a resumed mission's earlier steps are folded into the first user message."""
+    plan = [TaskNode(task_id=1, description="Ping the host.")]
+    history = [HistoryRecord(command="ping -c 4 example.com", observation="4 packets received"),
+               HistoryRecord(command="whois example.com", observation="Registrar: Example")]
+    engine._sync_messages("Ping example.com", plan, history)
+
+    assert [m["role"] for m in engine._messages] == ["system", "user", "user"]
+    seed = engine._messages[2]["content"]
+    assert "Action 1:\n  - Command: `ping -c 4 example.com`" in seed
+    assert "Action 2:\n  - Command: `whois example.com`" in seed
+
+
+def test_sync_messages_folds_old_steps_into_summaries(engine):
+    """
+    Tests that once 2 * HISTORY_WINDOW verbatim steps accumulate, all but the
+    last HISTORY_WINDOW are collapsed to one-line summaries in the seed message.
+    """
+    from agent.thought_engine import HISTORY_WINDOW
+    plan = [TaskNode(task_id=1, description="Enumerate the host.")]
+    history = []
+    engine._sync_messages("Enumerate example.com", plan, history)
+    for i in range(2 * HISTORY_WINDOW):
+        history.append(HistoryRecord(command=f"cmd {i + 1}", observation=f"line one of {i + 1}\nline two"))
+        engine._sync_messages("Enumerate example.com", plan, history)
+    assert len(engine._messages) == 3 + 2 * (2 * HISTORY_WINDOW)
+
+    history.append(HistoryRecord(command="cmd last", observation="done"))
+    engine._sync_messages("Enumerate example.com", plan, history)
+    assert len(engine._messages) == 3
+    seed = engine._messages[2]["content"]
+    folded = len(history) - HISTORY_WINDOW
+    assert f"{folded}. `cmd {folded}` -> line one of {folded}" in seed
+    assert f"Action {folded + 1}:\n  - Command: `cmd {folded + 1}`" in seed
+    assert "Command: `cmd 1`" not in seed
+
+
+def test_complete_json_prefers_parsed_and_falls_back_to_content(engine):
+    """Tests that structured outputs are used as-is, with raw content parsed only when needed."""
+    from types import SimpleNamespace
+    from agent.thought_engine import ToolSelection, _TOOL_SELECTION_ADAPTER
+
+    def fake_parse(parsed, content):
+        message = SimpleNamespace(parsed=parsed, content=content)
+        return lambda **kwargs: SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    expected = ToolSelection(tool_name="os_command", tool_input="id")
+    engine._parse = fake_parse(expected, None)
+    assert engine._complete_json([], ToolSelection, _TOOL_SELECTION_ADAPTER, temperature=0.2) is expected
+
+    engine._parse = fake_parse(None, 'Here you go: {"tool_name": "os_command", "tool_input": "id"}')
+    fallback = engine._complete_json([{"role": "user", "content": "again"}], ToolSelection,
+                                     _TOOL_SELECTION_ADAPTER, temperature=0.2)
+    assert fallback == expected and fallback is not expected
+
+
+def test_fallback_request_constrains_output_to_the_schema(engine, monkeypatch):
+    """Tests that clients without structured parsing still send the response model's JSON schema."""
+    from types import SimpleNamespace
+    from agent.thought_engine import PlanUpdate, _PLAN_UPDATE_ADAPTER
+    sent = {}
+
+    def fake_create(**kwargs):
+        sent.update(kwargs)
+        message = SimpleNamespace(content='{"completed_task_ids": [2]}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    engine._parse = None
+    monkeypatch.setattr(engine.client.chat.completions, "create", fake_create)
+    update = engine._request_json([], PlanUpdate, _PLAN_UPDATE_ADAPTER, temperature=0.0)
+
+    assert update.completed_task_ids == [2]
+    response_format = sent["response_format"]
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["schema"]["required"] == ["completed_task_ids"]
+
+
+def test_clean_json_response_ignores_braces_inside_strings():
+    """Tests that braces and quotes inside JSON string values do not end the scan early."""
+    from agent.thought_engine import _clean_json_response
+    obj = '{"tool_name": "os_command", "tool_input": "awk \'{print $1}\' f \\"}\\" x"}'
+    assert _clean_json_response(f"Result:\n{obj}\nDone.") == obj
+    assert _clean_json_response('ids: [1, [2, 3]] trailing') == '[1, [2, 3]]'
+
+
+def test_complete_json_caches_identical_requests(engine):
+    """Tests that an identical request is answered from the response cache without calling the LLM."""
+    from types import SimpleNamespace
+    from agent.thought_engine import ToolSelection, _TOOL_SELECTION_ADAPTER
+    calls = []
+
+    def fake_parse(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(parsed=ToolSelection(tool_name="os_command", tool_input="id"), content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    engine._parse = fake_parse
+    messages = [{"role": "user", "content": "next?"}]
+    first = engine._complete_json(messages, ToolSelection, _TOOL_SELECTION_ADAPTER, temperature=0.2)
+    second = engine._complete_json(list(messages), ToolSelection, _TOOL_SELECTION_ADAPTER, temperature=0.2)
+    engine._complete_json(messages + [{"role": "user", "content": "more"}], ToolSelection,
+                          _TOOL_SELECTION_ADAPTER, temperature=0.2)
+
+    assert first is second
+    assert len(calls) == 2
+
+
+def test_assessment_cache_survives_a_new_engine(tmp_path):
+    """Tests that a plan-status assessment stored on disk is reused by a later engine without calling the LLM."""
+    from agent.thought_engine import PlanUpdate, _ResponseCache
+    messages = [{"role": "user", "content": "Which tasks did `whoami` complete?"}]
+    key = _ResponseCache.key(PlanUpdate, messages, 0.0)
+    _ResponseCache(directory=tmp_path).put(key, PlanUpdate(completed_task_ids=[2]))
+
+    fresh = _ResponseCache(directory=tmp_path)
+    assert fresh.get(key, PlanUpdate) == PlanUpdate(completed_task_ids=[2])
+    assert _ResponseCache(directory=tmp_path, ttl=-1).get(key, PlanUpdate) is None
+
+
+def test_expired_disk_cache_entries_are_deleted(tmp_path):
+    """Tests that expired files are removed, both when read and when a cache is created, so the directory stays bounded."""
+    from agent.thought_engine import PlanUpdate, _ResponseCache
+    cache = _ResponseCache(directory=tmp_path)
+    cache.put("a" * 64, PlanUpdate(completed_task_ids=[1]))
+    cache.put("b" * 64, PlanUpdate(completed_task_ids=[2]))
+
+    expired = _ResponseCache(ttl=-1)
+    expired._directory = tmp_path
+    assert expired.get("a" * 64, PlanUpdate) is None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b" * 64 + ".json"]
+
+    _ResponseCache(directory=tmp_path, ttl=-1)
+    assert list(tmp_path.iterdir()) == []
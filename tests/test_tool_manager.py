@@ -0,0 +1,28 @@
+# dawnyawn/tests/test_tool_manager.py
+from tools.base_tool import BaseTool
+from tools.tool_manager import ToolManager
+
+
+class _EchoTool(BaseTool):
+    name = "echo_tool"
+    description = "Echoes its input."
+
+    def execute(self, tool_input: str) -> str:
+        return tool_input
+
+
+def test_manifest_is_memoized_until_a_tool_is_registered():
+    """
+    Tests that repeated manifest requests return the cached string, and
+    that registering a tool rebuilds it with the new entry.
+    """
+    manager = ToolManager()
+    first = manager.get_tool_manifest()
+    assert manager.get_tool_manifest() is first
+    assert "- Tool Name: `finish_mission`\n" in first
+    assert "- Tool Name: `os_command`\n" in first
+
+    manager._register_tool(_EchoTool())
+    rebuilt = manager.get_tool_manifest()
+    assert rebuilt is not first
+    assert rebuilt.endswith("- Tool Name: `echo_tool`\n  Description: Echoes its input.\n")
@@ -1,7 +1,10 @@
 # dawnyawn/tools/os_command_tool.py
+import logging
 from tools.base_tool import BaseTool
 from services.mcp_client import McpClient
 
+logger = logging.getLogger(__name__)
+
 class OsCommandTool(BaseTool):
     """A tool for executing shell commands in a secure, isolated Kali environment."""
     name = "os_command"
@@ -12,5 +15,5 @@ class OsCommandTool(BaseTool):
         self.mcp_client = McpClient()
 
     def execute(self, tool_input: str) -> str:
-        print(f"  > Executing OS Command via Kali Driver: {tool_input}")
+        logger.info("Executing OS Command via Kali Driver: %s", tool_input)
         return self.mcp_client.send_kali_command(tool_input)
\ No newline at end of file
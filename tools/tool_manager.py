@@ -11,6 +11,7 @@ class ToolManager:
     def __init__(self):
         """Initializes the ToolManager and triggers the tool discovery process."""
         self._tools: dict[str, BaseTool] = {}
+        self._manifest_cache: str | None = None
         logging.info("Initializing ToolManager and discovering tools...")
         self._discover_and_register_tools()
 
@@ -30,7 +31,7 @@ class ToolManager:
                         item = getattr(module, item_name)
                         if isinstance(item, type) and issubclass(item, BaseTool) and item is not BaseTool:
                             tool_instance = item()
-                            self._tools[tool_instance.name] = tool_instance
+                            self._register_tool(tool_instance)
                             logging.info("Dynamically loaded tool: '%s'", tool_instance.name)
                             # Assuming one tool class per file for simplicity
                             break
@@ -40,6 +41,11 @@ class ToolManager:
                 except Exception as e:
                     logging.error("An unexpected error occurred while loading tool from %s. Error: %s", module_name, e)
 
+    def _register_tool(self, tool: BaseTool):
+        """Adds a tool to the registry and drops the memoized manifest so it is rebuilt with the new tool."""
+        self._tools[tool.name] = tool
+        self._manifest_cache = None
+
     def get_tool(self, tool_name: str) -> BaseTool:
         """Retrieves a registered tool by its name."""
         return self._tools.get(tool_name)
@@ -47,22 +53,26 @@ class ToolManager:
     def get_tool_manifest(self) -> str:
         """
         Returns a formatted string of all available tools for the LLM's system prompt.
-        Includes the special 'finish_mission' command.
+        Includes the special 'finish_mission' command. The result is memoized until a tool is registered.
         """
-        manifest = "Your response must select one of the following available tools:\n"
+        if self._manifest_cache is not None:
+            return self._manifest_cache
 
-        # Add the special 'finish_mission' command to the manifest for the LLM
-        manifest += (
+        parts = [
+            "Your response must select one of the following available tools:\n",
+            # The special 'finish_mission' command, listed for the LLM alongside the real tools
             "- Tool Name: `finish_mission`\n"
             "  Description: Use this tool ONLY when you have fully accomplished the user's goal and have all the "
-            "information needed. Provide a final, detailed summary of your findings as the input.\n"
-        )
+            "information needed. Provide a final, detailed summary of your findings as the input.\n",
+        ]
 
         # Add all dynamically loaded tools to the manifest
         if not self._tools:
-            manifest += "\n- No other tools are currently available."
+            parts.append("\n- No other tools are currently available.")
         else:
-            for tool in self._tools.values():
-                manifest += f"- Tool Name: `{tool.name}`\n  Description: {tool.description}\n"
+            parts.extend(f"- Tool Name: `{tool.name}`\n  Description: {tool.description}\n"
+                         for tool in self._tools.values())
 
+        manifest = "".join(parts)
+        self._manifest_cache = manifest
         return manifest
\ No newline at end of file